@@ -1,11 +1,22 @@
+import sys
+import json
 import argparse
+import contextlib
 from modules.agent_core import summarize_file, plan_trip, maybe_send_email, export_plan_pdf
 
+def _flush_outbox():
+    from modules import outbox
+
+    remaining = outbox.flush()
+    if remaining:
+        print(f"[!] {remaining} email(s) still queued in data/outbox (will retry on next run)")
+
 def run_summarize(args):
     result = summarize_file(args.input)
     print(result)
     if args.email:
         maybe_send_email(args.email, "Travel Summary", result)
+        _flush_outbox()
         print(f"\n[+] Summary emailed to {args.email}")
 
 def run_plan(args):
@@ -13,14 +24,16 @@ def run_plan(args):
         city=args.city,
         start_date=args.start,
         days=args.days,
-        user_id=args.user,
+        user_name=args.user,
         vibe=args.vibe or "",
         fast=args.fast,
+        reuse=args.reuse,
     )
     print(itinerary)
     if args.email:
         subject = f"{args.days}-Day Travel Itinerary – {args.city} (from {args.start})"
         maybe_send_email(args.email, subject, itinerary)
+        _flush_outbox()
         print(f"\n[+] Itinerary emailed to {args.email}")
 
 def run_export_pdf(args):
@@ -28,46 +41,107 @@ def run_export_pdf(args):
         city=args.city,
         start_date=args.start,
         days=args.days,
-        user_id=args.user,
+        user_name=args.user,
         vibe=args.vibe or "",
         fast=args.fast,
+        reuse=args.reuse,
     )
     print(itinerary)
     print(f"[+] PDF generated: {pdf_path}")
 
+def run_export_pdf_batch(args):
+    from modules import batch
+
+    zip_path, report = batch.export_pdf_batch(
+        args.manifest, fast=args.fast, workers=args.workers, processes=args.processes, reuse=args.reuse
+    )
+    for entry in report:
+        detail = entry.get("pdf") if entry["status"] == "ok" else entry.get("error")
+        print(f"  row {entry['row']:>3}  {entry['status']:<5}  {entry.get('city', '')}: {detail}")
+    ok = sum(1 for e in report if e["status"] == "ok")
+    print(f"[+] {ok}/{len(report)} PDFs exported: {zip_path} (report.csv inside)")
+
+def run_plan_batch(args):
+    from modules import batch
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    ok = total = 0
+    try:
+        # stdout carries only NDJSON result lines: module diagnostics go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            for result in batch.plan_batch(batch.load_manifest(args.manifest), fast=args.fast,
+                                             workers=args.workers, reuse=args.reuse):
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                total += 1
+                ok += result["status"] == "ok"
+    finally:
+        if args.out:
+            out.close()
+    print(f"[+] {ok}/{total} trips planned" + (f": {args.out}" if args.out else ""), file=sys.stderr)
+
 def main():
     parser = argparse.ArgumentParser(description="AI Travel Operations Agent (CLI)")
     sub = parser.add_subparsers(dest="command")
 
-    p_sum = sub.add_parser("summarize", help="Summarize a booking PDF or ticket image")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--profile", action="store_true",
+                        help="Sample this run and write a profile + top-N summary to logs/profiles/")
+
+    p_sum = sub.add_parser("summarize", parents=[common], help="Summarize a booking PDF or ticket image")
     p_sum.add_argument("input", help="Path to PDF/image")
     p_sum.add_argument("--email", default=None)
     p_sum.set_defaults(func=run_summarize)
 
-    p_plan = sub.add_parser("plan", help="Plan a trip")
+    p_plan = sub.add_parser("plan", parents=[common], help="Plan a trip")
     p_plan.add_argument("--city", required=True)
     p_plan.add_argument("--start", required=True, help="YYYY-MM-DD")
     p_plan.add_argument("--days", required=True, type=int)
     p_plan.add_argument("--user", default="default")
     p_plan.add_argument("--vibe", default="")
     p_plan.add_argument("--fast", action="store_true")
+    p_plan.add_argument("--reuse", action="store_true", help="Reuse a recent stored plan of this user for a matching trip")
     p_plan.add_argument("--email", default=None)
     p_plan.set_defaults(func=run_plan)
 
-    p_pdf = sub.add_parser("export-pdf", help="Plan trip and export itinerary PDF with place photos")
+    p_pdf = sub.add_parser("export-pdf", parents=[common], help="Plan trip and export itinerary PDF with place photos")
     p_pdf.add_argument("--city", required=True)
     p_pdf.add_argument("--start", required=True)
     p_pdf.add_argument("--days", required=True, type=int)
     p_pdf.add_argument("--user", default="default")
     p_pdf.add_argument("--vibe", default="")
     p_pdf.add_argument("--fast", action="store_true")
+    p_pdf.add_argument("--reuse", action="store_true", help="Reuse a recent stored plan of this user for a matching trip")
     p_pdf.set_defaults(func=run_export_pdf)
 
+    p_pbatch = sub.add_parser("plan-batch", parents=[common], help="Plan every trip of a CSV/JSONL manifest, streaming NDJSON results")
+    p_pbatch.add_argument("manifest", help="CSV or JSONL with city,start,days[,user,vibe]")
+    p_pbatch.add_argument("--out", default=None, help="Write NDJSON here instead of stdout")
+    p_pbatch.add_argument("--fast", action="store_true")
+    p_pbatch.add_argument("--reuse", action="store_true", help="Reuse a recent stored plan of this user for a matching trip")
+    p_pbatch.add_argument("--workers", type=int, default=0, help="Concurrent plans (default: Ollama concurrency limit)")
+    p_pbatch.set_defaults(func=run_plan_batch)
+
+    p_batch = sub.add_parser("export-pdf-batch", parents=[common], help="Export itinerary PDFs for every row of a CSV/JSONL manifest")
+    p_batch.add_argument("manifest", help="CSV or JSONL with city,start,days[,user,vibe]")
+    p_batch.add_argument("--fast", action="store_true")
+    p_batch.add_argument("--reuse", action="store_true", help="Reuse a recent stored plan of this user for a matching trip")
+    p_batch.add_argument("--workers", type=int, default=0, help="Concurrent plans (default: Ollama concurrency limit)")
+    p_batch.add_argument("--processes", type=int, default=0, help="PDF render processes (default: CPU count)")
+    p_batch.set_defaults(func=run_export_pdf_batch)
+
     args = parser.parse_args()
     if not args.command:
         parser.print_help()
         return
-    args.func(args)
+    if not args.profile:
+        args.func(args)
+        return
+
+    from modules import profiling
+
+    with profiling.profile(args.command):
+        args.func(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,74 @@
+"""
+Import-time budget check for the CLI and web entry points.
+
+Each target is imported in a fresh interpreter with `-X importtime`; the median
+cumulative time must stay under the budget and none of the heavy tool stacks
+(ReportLab, pdfminer, pytesseract, PIL) may be imported eagerly.
+
+    python -m bench.import_budget --budget-ms 150
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = ("agent", "web_app")
+HEAVY_MODULES = ("reportlab", "pdfminer", "pytesseract", "PIL")
+
+
+def _measure(target: str) -> tuple[float, list[str]]:
+    code = (
+        "import sys, json\n"
+        f"import {target}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    cumulative_us = 0
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == target:
+            cumulative_us = int(parts[1])
+    return cumulative_us / 1000, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Check cold import time of the entry points")
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="Budget for `import agent`")
+    parser.add_argument("--web-budget-ms", type=float, default=600.0, help="Budget for `import web_app` (Flask)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    budgets = {"agent": args.budget_ms, "web_app": args.web_budget_ms}
+    failed = False
+    for target in TARGETS:
+        samples = []
+        heavy: list[str] = []
+        for _ in range(args.runs):
+            ms, loaded = _measure(target)
+            samples.append(ms)
+            heavy = sorted(set(heavy) | set(loaded))
+
+        median = statistics.median(samples)
+        ok = median <= budgets[target] and not heavy
+        failed = failed or not ok
+        status = "OK" if ok else "FAIL"
+        print(f"[{status}] import {target}: median {median:.1f} ms (budget {budgets[target]:.0f} ms)"
+              + (f", eagerly imports {', '.join(heavy)}" if heavy else ""))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
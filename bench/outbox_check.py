@@ -0,0 +1,134 @@
+"""
+Email outbox checks against the local SMTP stand-in (bench/smtp_stub.py).
+
+Covers per-recipient rejections (a 550 must not hold back the rest of the batch and
+goes straight to failed/), temporary 4xx replies, an unreachable server, and two
+processes draining the same outbox (every message must be delivered exactly once).
+
+    python -m bench.outbox_check
+"""
+import os
+import sys
+import json
+import tempfile
+import multiprocessing
+from collections import Counter
+
+from bench.smtp_stub import SmtpStub
+
+
+def _point_outbox(workdir: str) -> None:
+    from modules import outbox
+
+    outbox.OUTBOX_DIR = os.path.join(workdir, "outbox")
+    outbox.FAILED_DIR = os.path.join(outbox.OUTBOX_DIR, "failed")
+
+
+def _records(directory: str) -> list[dict]:
+    if not os.path.isdir(directory):
+        return []
+    out = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                out.append(json.load(f))
+    return out
+
+
+def _flush_in_child(workdir: str, env: dict) -> None:
+    # Runs in a separate process, like `podman exec ... agent.py` next to the web worker
+    os.environ.update(env)
+    _point_outbox(workdir)
+    from modules import outbox
+
+    outbox.flush()
+
+
+def check_rejections() -> list[str]:
+    from modules import outbox
+
+    errors = []
+    with SmtpStub(reject={"bad@x.test"}, defer={"later@x.test"}) as smtp, tempfile.TemporaryDirectory() as workdir:
+        os.environ.update(smtp.env())
+        _point_outbox(workdir)
+        for to in ("bad@x.test", "good1@x.test", "later@x.test", "good2@x.test"):
+            outbox.enqueue(to, f"to {to}", "body")
+        outbox.flush()
+
+        sent = sorted(r for r, _ in smtp.delivered)
+        if sent != ["good1@x.test", "good2@x.test"]:
+            errors.append(f"rejections: expected good1/good2 delivered, got {sent}")
+        failed = _records(outbox.FAILED_DIR)
+        if [(r["to"], r["attempts"]) for r in failed] != [("bad@x.test", 1)]:
+            errors.append(f"rejections: 550 recipient should be in failed/ after 1 attempt, got {failed}")
+        queued = _records(outbox.OUTBOX_DIR)
+        if [(r["to"], r["attempts"]) for r in queued] != [("later@x.test", 1)]:
+            errors.append(f"rejections: 451 recipient should stay queued for retry, got {queued}")
+    return errors
+
+
+def check_server_down() -> list[str]:
+    from modules import outbox
+
+    errors = []
+    with SmtpStub() as smtp:
+        env = smtp.env()
+    # The stub is stopped: its port now refuses connections
+    os.environ.update(env)
+    with tempfile.TemporaryDirectory() as workdir:
+        _point_outbox(workdir)
+        outbox.enqueue("someone@x.test", "down", "body")
+        remaining = outbox.flush()
+        queued = _records(outbox.OUTBOX_DIR)
+        if remaining != 1 or [r["attempts"] for r in queued] != [1]:
+            errors.append(f"server down: expected 1 message queued for retry, got {remaining} / {queued}")
+    return errors
+
+
+def check_two_processes(messages: int = 40) -> list[str]:
+    from modules import outbox
+
+    errors = []
+    with SmtpStub(latency=0.01) as smtp, tempfile.TemporaryDirectory() as workdir:
+        env = smtp.env()
+        os.environ.update(env)
+        _point_outbox(workdir)
+        # This process's outbox worker keeps draining as well, like the web app next to
+        # `podman exec ... agent.py` runs
+        for n in range(messages):
+            outbox.enqueue(f"user{n}@x.test", f"msg {n}", "body")
+
+        ctx = multiprocessing.get_context("spawn")
+        procs = [ctx.Process(target=_flush_in_child, args=(workdir, env)) for _ in range(2)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        with outbox._send_lock:  # let this process's worker finish its current batch
+            pass
+
+        counts = Counter(subject for _, subject in smtp.delivered)
+        duplicates = {s: n for s, n in counts.items() if n > 1}
+        if duplicates:
+            errors.append(f"two processes: {len(duplicates)} messages delivered more than once")
+        if len(counts) != messages:
+            errors.append(f"two processes: {len(counts)}/{messages} messages delivered")
+        if outbox.pending() or outbox._claimed():
+            errors.append("two processes: outbox not empty after both flushes")
+    return errors
+
+
+def main() -> int:
+    failed = False
+    for name, check in (("rejections", check_rejections), ("server down", check_server_down),
+                        ("two processes", check_two_processes)):
+        errors = check()
+        failed = failed or bool(errors)
+        print(f"[{'FAIL' if errors else 'OK'}] {name}")
+        for e in errors:
+            print(f"       {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+Per-page cost of the itinerary PDF export.
+
+Renders synthetic itineraries of several lengths (with stub photos) in memory and
+to disk and reports ms per page.
+
+    python -m bench.pdf_bench --days 1 5 10 30 --repeat 5
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+from bench.stubs import StubConfig, render_itinerary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark itinerary PDF rendering per page")
+    parser.add_argument("--days", type=int, nargs="+", default=[1, 5, 10, 30])
+    parser.add_argument("--images", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    from modules import pdf_export
+
+    with tempfile.TemporaryDirectory(prefix="travel-pdf-bench-") as workdir:
+        pdf_export.PDF_DIR = os.path.join(workdir, "itineraries")
+
+        photo = os.path.join(workdir, "photo.jpg")
+        with open(photo, "wb") as f:
+            f.write(StubConfig().photo_bytes)
+        images = [(f"Stub Place {i}", photo, (900, 600)) for i in range(args.images)]
+        attributions = [f"Stub Place {i}: <a href='https://example.com'>Stub Photographer</a>" for i in range(args.images)]
+
+        print("days  pages  mode    median_ms  ms_per_page")
+        for days in args.days:
+            dates = [f"2025-01-{(d % 28) + 1:02d}" for d in range(days)]
+            text = render_itinerary(dates, [f"Stub Place {i}" for i in range(8)])
+            title = f"{days}-Day Itinerary — Bench City"
+
+            pages = 0  # taken from the memory run; disk mode renders the same document
+            for mode in ("memory", "disk"):
+                samples = []
+                for r in range(args.repeat):
+                    started = time.perf_counter()
+                    if mode == "memory":
+                        _data, pages = pdf_export.render_itinerary_pdf(title, text, images, attributions)
+                    else:
+                        pdf_export.export_itinerary_pdf(f"bench_{days}_{r}.pdf", title, text, images, attributions)
+                    samples.append((time.perf_counter() - started) * 1000)
+                median = statistics.median(samples)
+                print(f"{days:<5} {pages:<6} {mode:<7} {median:<10.1f} {median / max(1, pages):.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Offline end-to-end benchmark.
+
+Starts local stand-ins for Ollama, Google Places and the geocoder, points the
+agent at them and drives plan_trip / export_plan_pdf / summarize_file and the
+Flask routes at a configurable concurrency.
+
+    python -m bench.run_bench --scenario plan --requests 40 --concurrency 4
+    python -m bench.run_bench --scenario all --token-rate 80 --invalid-rate 0.3 --json bench_output.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.stubs import CITIES, StubConfig, StubServer
+
+SCENARIOS = ("plan", "export", "summarize", "http-plan", "http-summarize")
+VIBES = ["food, night markets", "museums and history", "nightlife", "parks, chill pace", "shopping, anime", ""]
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _isolate_data_dirs(workdir: str) -> None:
+    """
+    Point every on-disk store at a scratch directory so runs never touch data/ or exports/.
+    """
+    from modules import cache, memory, plan_store, pdf_export, place_photos, outbox, metrics, batch, token_stats, profiling
+
+    cache.CACHE_PATH = os.path.join(workdir, "data", "cache.json")
+    memory.HISTORY_PATH = os.path.join(workdir, "data", "history_trip.json")
+    plan_store.STORE_PATH = os.path.join(workdir, "data", "plan_store.json")
+    outbox.OUTBOX_DIR = os.path.join(workdir, "data", "outbox")
+    outbox.FAILED_DIR = os.path.join(outbox.OUTBOX_DIR, "failed")
+    pdf_export.PDF_DIR = os.path.join(workdir, "exports", "itineraries")
+    place_photos.IMG_DIR = os.path.join(workdir, "exports", "images")
+    metrics.TRACE_PATH = os.path.join(workdir, "logs", "trace.jsonl")
+    batch.BATCH_DIR = os.path.join(workdir, "exports", "batches")
+    token_stats.STATS_PATH = os.path.join(workdir, "data", "token_stats.json")
+    profiling.PROFILE_DIR = os.path.join(workdir, "logs", "profiles")
+
+    import web_app
+
+    web_app.UPLOAD_DIR = os.path.join(workdir, "uploads")
+    web_app.EXPORT_PDF_DIR = pdf_export.PDF_DIR
+
+
+def _sample_pdf(workdir: str) -> str:
+    from reportlab.pdfgen import canvas
+
+    path = os.path.join(workdir, "booking.pdf")
+    c = canvas.Canvas(path)
+    y = 800
+    for line in [
+        "E-Ticket Receipt", "Passenger: DOE/JOHN", "Flight BR 198  TPE -> NRT",
+        "Date: 2025-12-31  Departure 08:40", "Class: Economy", "Baggage: 23KG",
+    ] * 6:
+        c.drawString(60, y, line)
+        y -= 18
+    c.save()
+    return path
+
+
+def _trip(rng: random.Random, max_days: int) -> dict:
+    city = rng.choice(list(CITIES.values()))
+    return {
+        "city": f"{city[0]}, {city[1]}",
+        "start_date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "days": rng.randint(1, max_days),
+        "user_name": f"bench-user-{rng.randint(1, 20)}",
+        "vibe": rng.choice(VIBES),
+    }
+
+
+def _make_job(scenario: str, rng: random.Random, args, sample_pdf: str):
+    from modules import agent_core
+
+    if scenario == "summarize":
+        return lambda: agent_core.summarize_file(sample_pdf)
+
+    if scenario == "http-summarize":
+        import web_app
+
+        def job():
+            client = web_app.app.test_client()
+            with open(sample_pdf, "rb") as f:
+                resp = client.post("/summarize", data={"file": (f, "booking.pdf")},
+                                   content_type="multipart/form-data")
+            if resp.status_code != 200:
+                raise RuntimeError(f"HTTP {resp.status_code}")
+        return job
+
+    trip = _trip(rng, args.max_days)
+    if scenario == "plan":
+        return lambda: agent_core.plan_trip(trip["city"], trip["start_date"], trip["days"],
+                                            trip["user_name"], trip["vibe"], reuse=args.reuse)
+    if scenario == "export":
+        return lambda: agent_core.export_plan_pdf(trip["city"], trip["start_date"], trip["days"],
+                                                  trip["user_name"], trip["vibe"], True, reuse=args.reuse)
+    if scenario == "http-plan":
+        import web_app
+
+        def job():
+            client = web_app.app.test_client()
+            resp = client.post("/plan", data={
+                "city": trip["city"], "start": trip["start_date"], "days": str(trip["days"]),
+                "user_name": trip["user_name"], "vibe": trip["vibe"],
+                **({"reuse_plan": "on"} if args.reuse else {}),
+            })
+            if resp.status_code != 200:
+                raise RuntimeError(f"HTTP {resp.status_code}")
+        return job
+
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def run_scenario(scenario: str, args, sample_pdf: str) -> dict:
+    rng = random.Random(args.seed)
+    jobs = [_make_job(scenario, rng, args, sample_pdf) for _ in range(args.requests)]
+
+    def timed(job):
+        start = time.perf_counter()
+        try:
+            job()
+            return time.perf_counter() - start, None
+        except Exception as e:
+            if args.verbose:
+                traceback.print_exc()
+            return time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+    for job in jobs[: args.warmup]:
+        timed(job)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(timed, jobs))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(r[0] for r in results if r[1] is None)
+    errors = [r[1] for r in results if r[1] is not None]
+    return {
+        "scenario": scenario,
+        "requests": len(results),
+        "concurrency": args.concurrency,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def _print_table(rows: list[dict]) -> None:
+    cols = ["scenario", "requests", "concurrency", "errors", "rps", "mean_ms", "p50_ms", "p95_ms", "p99_ms"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+    for r in rows:
+        if r["first_error"]:
+            print(f"[!] {r['scenario']}: first error: {r['first_error']}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmark with stub services")
+    parser.add_argument("--scenario", default="all", choices=("all",) + SCENARIOS)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--max-days", type=int, default=5)
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Stub Ollama output tokens/sec")
+    parser.add_argument("--prompt-rate", type=float, default=2000.0, help="Stub Ollama prompt tokens/sec")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="Share of invalid planner outputs")
+    parser.add_argument("--places-latency", type=float, default=0.05)
+    parser.add_argument("--geocode-latency", type=float, default=0.03)
+    parser.add_argument("--photo-latency", type=float, default=0.05)
+    parser.add_argument("--ollama-backends", type=int, default=1,
+                        help="Number of stub Ollama servers behind OLLAMA_HOSTS")
+    parser.add_argument("--reuse", action="store_true", help="Allow plan_store reuse (off: always generate)")
+    parser.add_argument("--admission", action="store_true",
+                        help="Keep web admission control on (off: HTTP scenarios are not rate limited)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", default=None, help="Write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    cfg = StubConfig(
+        token_rate=args.token_rate,
+        prompt_rate=args.prompt_rate,
+        invalid_rate=args.invalid_rate,
+        places_latency=args.places_latency,
+        geocode_latency=args.geocode_latency,
+        photo_latency=args.photo_latency,
+        seed=args.seed,
+    )
+
+    with StubServer(cfg) as stub, tempfile.TemporaryDirectory(prefix="travel-bench-") as workdir:
+        # Module-level settings are read at import time, so the environment must be set first
+        os.environ.update(stub.env())
+        os.environ["ADMISSION_ENABLED"] = "1" if args.admission else "0"
+        extra = [StubServer(cfg).__enter__() for _ in range(max(0, args.ollama_backends - 1))]
+        if extra:
+            os.environ["OLLAMA_HOSTS"] = ",".join([stub.base_url] + [s.base_url for s in extra])
+        _isolate_data_dirs(workdir)
+
+        sample_pdf = _sample_pdf(workdir)
+        scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+        rows = [run_scenario(s, args, sample_pdf) for s in scenarios]
+        for server in extra:
+            server.__exit__(None, None, None)
+
+    _print_table(rows)
+    print(f"stub requests: {cfg.requests}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"results": rows, "stub_requests": cfg.requests, "args": vars(args)}, f, indent=2)
+    return 1 if any(r["errors"] for r in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
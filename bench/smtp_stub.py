@@ -0,0 +1,105 @@
+"""
+Local SMTP stand-in for the email outbox: plain SMTP (no STARTTLS/AUTH), records every
+delivered message and can reject chosen recipients.
+
+    with SmtpStub(reject={"bad@example.com"}) as smtp:
+        os.environ.update(smtp.env())
+        ...
+        smtp.delivered  # [(rcpt, subject), ...]
+"""
+import time
+import threading
+from email import message_from_bytes
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+
+class SmtpStub:
+    def __init__(self, reject: set | None = None, defer: set | None = None, latency: float = 0.0):
+        self.reject = {r.lower() for r in reject or ()}  # 550: permanent
+        self.defer = {r.lower() for r in defer or ()}  # 451: try again later
+        self.latency = latency  # seconds per accepted message
+        self.delivered: list[tuple[str, str]] = []
+        self.refused: list[str] = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server: ThreadingTCPServer | None = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def env(self) -> dict:
+        return {
+            "SMTP_HOST": "127.0.0.1",
+            "SMTP_PORT": str(self.port),
+            "SMTP_STARTTLS": "0",
+            "SMTP_USER": "",
+            "SMTP_PASS": "",
+            "EMAIL_FROM": "agent@example.com",
+        }
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(StreamRequestHandler):
+            def reply(self, line: str) -> None:
+                self.wfile.write((line + "\r\n").encode("ascii"))
+
+            def handle(self):
+                with stub._lock:
+                    stub.connections += 1
+                self.reply("220 stub ESMTP")
+                rcpts: list[str] = []
+                while True:
+                    raw = self.rfile.readline()
+                    if not raw:
+                        return
+                    cmd = raw.decode("utf-8", "replace").strip()
+                    verb = cmd[:4].upper()
+                    if verb in ("EHLO", "HELO"):
+                        self.reply("250 stub")
+                    elif verb == "MAIL":
+                        rcpts = []
+                        self.reply("250 OK")
+                    elif verb == "RCPT":
+                        addr = cmd.split(":", 1)[1].strip().strip("<>").lower()
+                        if addr in stub.reject:
+                            with stub._lock:
+                                stub.refused.append(addr)
+                            self.reply("550 No such user")
+                        elif addr in stub.defer:
+                            self.reply("451 Try again later")
+                        else:
+                            rcpts.append(addr)
+                            self.reply("250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        lines = []
+                        while True:
+                            line = self.rfile.readline()
+                            if not line or line in (b".\r\n", b".\n"):
+                                break
+                            lines.append(line[1:] if line.startswith(b"..") else line)
+                        time.sleep(stub.latency)
+                        subject = message_from_bytes(b"".join(lines)).get("Subject", "")
+                        with stub._lock:
+                            stub.delivered.extend((r, subject) for r in rcpts)
+                        self.reply("250 OK queued")
+                    elif verb in ("RSET", "NOOP"):
+                        rcpts = []
+                        self.reply("250 OK")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+        ThreadingTCPServer.allow_reuse_address = True
+        self._server = ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,311 @@
+"""
+Local stand-ins for the external services the agent talks to:
+Ollama /api/chat, Google Places Text Search + Photos and the Open-Meteo geocoder.
+"""
+import io
+import re
+import ast
+import json
+import time
+import random
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image
+
+CITIES = {
+    "seoul": ("Seoul", "South Korea", 37.566, 126.978, "Asia/Seoul"),
+    "osaka": ("Osaka", "Japan", 34.694, 135.502, "Asia/Tokyo"),
+    "bangkok": ("Bangkok", "Thailand", 13.754, 100.501, "Asia/Bangkok"),
+    "sydney": ("Sydney", "Australia", -33.868, 151.209, "Australia/Sydney"),
+    "paris": ("Paris", "France", 48.853, 2.349, "Europe/Paris"),
+}
+
+SUMMARY_TEXT = """Flights:
+- BR 198, Taipei (TPE) -> Tokyo (NRT), 2025-12-31 08:40
+
+Hotels:
+- (not present)
+
+Dates/Times:
+- Departure 2025-12-31 08:40
+
+Luggage:
+- 23 kg checked
+
+Other:
+- Economy class
+"""
+
+
+def _seed(text: str) -> int:
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+class StubConfig:
+    def __init__(
+        self,
+        token_rate: float = 200.0,
+        prompt_rate: float = 2000.0,
+        invalid_rate: float = 0.0,
+        places_latency: float = 0.05,
+        geocode_latency: float = 0.03,
+        photo_latency: float = 0.05,
+        seed: int = 7,
+    ):
+        self.token_rate = token_rate
+        self.prompt_rate = prompt_rate
+        self.invalid_rate = invalid_rate
+        self.places_latency = places_latency
+        self.geocode_latency = geocode_latency
+        self.photo_latency = photo_latency
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.requests = {"chat": 0, "textsearch": 0, "photo": 0, "geocode": 0}
+        self.photo_bytes = self._make_photo()
+
+    def roll(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def count(self, kind: str) -> None:
+        with self.rng_lock:
+            self.requests[kind] += 1
+
+    @staticmethod
+    def _make_photo() -> bytes:
+        img = Image.new("RGB", (900, 600), (90, 140, 200))
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=70)
+        return buf.getvalue()
+
+
+def _allowed_names(prompt: str) -> list[str]:
+    m = re.search(r"Allowed places[^\n]*:\s*\n(.*?)(?:\n\s*\n|\Z)", prompt, re.DOTALL)
+    if m:
+        names = []
+        for line in m.group(1).splitlines():
+            line = line.strip()
+            if line.startswith("- "):
+                names.append(line[2:].strip())
+            elif ":" in line and line.lower().startswith("day "):
+                names += [n.strip() for n in line.split(":", 1)[1].split(" | ") if n.strip()]
+        if names:
+            return list(dict.fromkeys(names))
+
+    m = re.search(r"Allowed places[^\n]*:\s*\n(\[.*?\])", prompt, re.DOTALL)
+    if m:
+        try:
+            return list(ast.literal_eval(m.group(1)))
+        except Exception:
+            pass
+    return ["Central Park"]
+
+
+def _trip_dates(prompt: str) -> list[str]:
+    days_m = re.search(r"EXACTLY (\d+) days|Required days: (\d+)", prompt)
+    days = int(next(g for g in days_m.groups() if g)) if days_m else 1
+    first = re.search(r"\d{4}-\d{2}-\d{2}", prompt)
+    start = datetime.strptime(first.group(0), "%Y-%m-%d") if first else datetime(2025, 1, 1)
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+
+
+def render_itinerary(dates: list[str], names: list[str], drop_last_day: bool = False) -> str:
+    lines = []
+    used = []
+    for i, d in enumerate(dates):
+        if drop_last_day and i == len(dates) - 1 and len(dates) > 1:
+            break
+        picks = [names[(i * 3 + k) % len(names)] for k in range(3)]
+        used += picks
+        lines += [f"Day {i + 1} – {d}", f"- Morning: {picks[0]}", f"- Afternoon: {picks[1]}", f"- Evening: {picks[2]}", ""]
+    lines.append("Places Used:")
+    lines += [f"- {n}" for n in dict.fromkeys(used)]
+    return "\n".join(lines)
+
+
+def _chat_reply(cfg: StubConfig, messages: list[dict]) -> str:
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    first_user = next((m["content"] for m in messages if m.get("role") == "user"), "")
+    last_user = messages[-1]["content"] if messages else ""
+
+    if "Mode: Summarizer" in first_user:
+        return SUMMARY_TEXT
+
+    corrective = "strict validator" in system or len(messages) > 2
+    prompt = last_user if "strict validator" in system else first_user
+    dates = _trip_dates(prompt)
+    names = _allowed_names(prompt)
+    invalid = not corrective and cfg.roll() < cfg.invalid_rate
+    return render_itinerary(dates, names, drop_last_day=invalid)
+
+
+def _common_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _make_handler(cfg: StubConfig):
+    # Like Ollama's per-slot KV cache: the last few evaluated sequences (prompt + answer)
+    # of this server; a new prompt only pays for what follows the longest shared prefix.
+    kv_cache: list[str] = []
+    kv_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # noqa: A002 - silence per-request logging
+            pass
+
+        def _send(self, status: int, body: bytes, ctype: str = "application/json") -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, obj: dict, status: int = 200) -> None:
+            self._send(status, json.dumps(obj).encode("utf-8"))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            qs = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+            if url.path.endswith("/api/tags"):
+                return self._json({"models": [{"name": "mistral:latest"}]})
+            if url.path.endswith("/api/ps"):
+                return self._json({"models": [{"name": "mistral:latest"}]})
+
+            if url.path.endswith("/place/textsearch/json"):
+                cfg.count("textsearch")
+                time.sleep(cfg.places_latency)
+                return self._json({"status": "OK", "results": self._places(qs.get("query", ""))})
+
+            if url.path.endswith("/place/photo"):
+                cfg.count("photo")
+                time.sleep(cfg.photo_latency)
+                return self._send(200, cfg.photo_bytes, "image/jpeg")
+
+            if url.path.endswith("/v1/search"):
+                cfg.count("geocode")
+                time.sleep(cfg.geocode_latency)
+                name = qs.get("name", "").split(",")[0].strip().lower()
+                city = CITIES.get(name)
+                if not city:
+                    return self._json({})
+                return self._json({"results": [{
+                    "name": city[0], "country": city[1], "latitude": city[2],
+                    "longitude": city[3], "timezone": city[4],
+                }]})
+
+            self._send(404, b"{}")
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length", "0"))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not url.path.endswith("/api/chat"):
+                return self._send(404, b"{}")
+
+            cfg.count("chat")
+            messages = payload.get("messages", [])
+            content = _chat_reply(cfg, messages)
+
+            serialized = "".join(f"<{m.get('role')}>{m.get('content', '')}" for m in messages)
+            with kv_lock:
+                cached = max((_common_prefix(serialized, seq) for seq in kv_cache), default=0)
+            prompt_tokens = max(1, (len(serialized) - cached) // 4)
+            output_tokens = max(1, len(content) // 4)
+            num_predict = int((payload.get("options") or {}).get("num_predict", 420))
+            done_reason = "stop"
+            if output_tokens > num_predict:
+                content = content[: num_predict * 4]
+                output_tokens = num_predict
+                done_reason = "length"
+
+            with kv_lock:
+                kv_cache.append(serialized + f"<assistant>{content}")
+                del kv_cache[:-4]
+
+            prompt_s = prompt_tokens / cfg.prompt_rate
+            eval_s = output_tokens / cfg.token_rate
+            time.sleep(prompt_s + eval_s)
+
+            self._json({
+                "model": payload.get("model"),
+                "message": {"role": "assistant", "content": content},
+                "done": True,
+                "done_reason": done_reason,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_s * 1e9),
+                "eval_count": output_tokens,
+                "eval_duration": int(eval_s * 1e9),
+                "load_duration": 0,
+                "total_duration": int((prompt_s + eval_s) * 1e9),
+            })
+
+        @staticmethod
+        def _places(query: str) -> list[dict]:
+            city_key = query.split(",")[0].split(" ")[0].strip().lower()
+            city = CITIES.get(city_key, ("Somewhere", "Nowhere", 0.0, 0.0, "UTC"))
+            # Different queries return overlapping windows of the same places so dedupe is exercised
+            offset = _seed(query) % 18
+            results = []
+            for i in range(12):
+                idx = offset + i
+                pid = hashlib.sha1(f"{city[0]}:{idx}".encode()).hexdigest()[:20]
+                rng = random.Random(_seed(pid))
+                results.append({
+                    "name": f"{city[0]} Spot {idx}",
+                    "rating": round(rng.uniform(3.8, 4.9), 1),
+                    "formatted_address": f"{idx + 1} Stub Street, {city[0]}",
+                    "place_id": pid,
+                    "geometry": {"location": {"lat": city[2] + rng.uniform(-0.05, 0.05),
+                                              "lng": city[3] + rng.uniform(-0.05, 0.05)}},
+                    "photos": [{
+                        "photo_reference": f"ref_{pid}",
+                        "height": 600,
+                        "width": 900,
+                        "html_attributions": [f'<a href="https://example.com/{pid}">Stub Photographer</a>'],
+                    }],
+                })
+            return results
+
+    return Handler
+
+
+class StubServer:
+    def __init__(self, cfg: StubConfig):
+        self.cfg = cfg
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(cfg))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> dict:
+        base = self.base_url
+        return {
+            "OLLAMA_HOST": base,
+            "PLACES_API_KEY": "bench-key",
+            "PLACES_TEXTSEARCH_URL": f"{base}/maps/api/place/textsearch/json",
+            "PLACES_PHOTO_URL": f"{base}/maps/api/place/photo",
+            "GEOCODING_URL": f"{base}/v1/search",
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -1,15 +1,38 @@
-from . import (  # noqa: F401
-    llm,
-    pdf_parser,
-    ocr,
-    places,
-    place_photos,
-    pdf_export,
-    emailer,
-    memory,
-    cityinfo,
-    season,
-    agent_core,
-    cache,
-    validator,
-)
+import importlib
+
+# Submodules are imported on first use so e.g. `agent.py plan` never pays for
+# ReportLab and `agent.py summarize` never pays for the PDF export stack.
+__all__ = [
+    "llm",
+    "pdf_parser",
+    "ocr",
+    "places",
+    "place_photos",
+    "pdf_export",
+    "emailer",
+    "memory",
+    "cityinfo",
+    "season",
+    "agent_core",
+    "cache",
+    "validator",
+    "plan_store",
+    "outbox",
+    "metrics",
+    "config",
+    "geo",
+    "batch",
+    "admission",
+    "token_stats",
+    "profiling",
+]
+
+
+def __getattr__(name: str):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,190 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+from modules import config, metrics, memory  # noqa: F401 - config loads config/.env
+
+# Cost unit = expected LLM output tokens (num_predict); prompt tokens count at PROMPT_TOKEN_WEIGHT
+PROMPT_TOKEN_WEIGHT = 0.1
+
+ENABLED = os.getenv("ADMISSION_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+# Requests allowed to run against Ollama at once (default: backends x OLLAMA_NUM_PARALLEL)
+MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "0"))
+# Per-user token bucket: burst size and refill rate, in cost units
+USER_BURST = float(os.getenv("ADMISSION_USER_BURST", "8000"))
+USER_RATE = float(os.getenv("ADMISSION_USER_RATE", "10"))
+# Reject instead of queueing when the estimated wait is longer than this
+MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT", "120"))
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+# Per-client batch bucket (/plan/batch): a whole batch is charged once, then its rows wait for slots
+BATCH_BURST = float(os.getenv("ADMISSION_BATCH_BURST", "60000"))
+BATCH_RATE = float(os.getenv("ADMISSION_BATCH_RATE", "20"))
+# Optional per-user weights for the fair queue, e.g. "ops team=2,guest=0.5"
+WEIGHTS = {
+    memory._normalize_user_key(k): float(v)
+    for k, _, v in (item.partition("=") for item in os.getenv("ADMISSION_WEIGHTS", "").split(","))
+    if k.strip() and v.strip()
+}
+# Starting guess for LLM seconds per cost unit, refined from completed requests
+INITIAL_SECONDS_PER_TOKEN = 0.05
+
+
+class AdmissionRejected(RuntimeError):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+_cond = threading.Condition()
+_buckets: dict[str, tuple[float, float]] = {}  # user -> (tokens, last refill time)
+_batch_buckets: dict[str, tuple[float, float]] = {}  # client -> (tokens, last refill time)
+_last_finish: dict[str, float] = {}  # user -> virtual finish tag of their latest request
+_waiting: list[tuple[float, int, str]] = []  # heap of (finish tag, seq, user)
+_waiting_cost: dict[int, float] = {}
+_running_cost = 0.0
+_running = 0
+_virtual_time = 0.0
+_seconds_per_token = INITIAL_SECONDS_PER_TOKEN
+_seq = itertools.count()
+
+
+def estimate_cost(num_predict: int, prompt_tokens: int = 0) -> float:
+    return float(num_predict) + prompt_tokens * PROMPT_TOKEN_WEIGHT
+
+
+def _slots() -> int:
+    if MAX_CONCURRENT > 0:
+        return MAX_CONCURRENT
+    from modules import llm
+
+    return llm.concurrency_limit()
+
+
+def _draw(buckets: dict, key: str, cost: float, now: float, burst: float, rate: float) -> float:
+    # Returns 0 when the tokens were taken, else the seconds until enough have refilled
+    tokens, updated = buckets.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - updated) * rate)
+    # A single request larger than the burst is admitted once the bucket is full
+    needed = min(cost, burst)
+    if tokens < needed:
+        buckets[key] = (tokens, now)
+        return (needed - tokens) / rate if rate > 0 else MAX_WAIT_SECONDS
+    buckets[key] = (tokens - needed, now)
+    return 0.0
+
+
+def _take_tokens(user: str, cost: float, now: float) -> None:
+    shortfall = _draw(_buckets, user, cost, now, USER_BURST, USER_RATE)
+    if shortfall:
+        metrics.inc("admission_rejected_total", {"reason": "user_quota"})
+        raise AdmissionRejected("Too many large requests from this user. Please retry later.", shortfall)
+
+
+def _refund_tokens(user: str, cost: float) -> None:
+    tokens, updated = _buckets.get(user, (USER_BURST, time.time()))
+    _buckets[user] = (min(USER_BURST, tokens + min(cost, USER_BURST)), updated)
+
+
+def _estimated_wait(cost: float) -> float:
+    ahead = _running_cost + sum(_waiting_cost.values())
+    return (ahead / _slots()) * _seconds_per_token if _running >= _slots() else 0.0
+
+
+def charge_batch(client_name: str, cost: float) -> None:
+    """
+    Charges a whole batch (sum of its row costs) once against the client's batch bucket.
+    Raises AdmissionRejected when the client is over its batch quota; the rows are then
+    admitted with admit(..., prepaid=True).
+    """
+    if not ENABLED:
+        return
+    with _cond:
+        shortfall = _draw(_batch_buckets, memory._normalize_user_key(client_name), cost, time.time(),
+                          BATCH_BURST, BATCH_RATE)
+    if shortfall:
+        metrics.inc("admission_rejected_total", {"reason": "batch_quota"})
+        raise AdmissionRejected("Too many batch trips from this client. Please retry later.", shortfall)
+
+
+@contextmanager
+def admit(user_name: str, cost: float, prepaid: bool = False):
+    """
+    Holds one LLM slot for the duration of the block. Slots are granted in weighted fair
+    queueing order (smallest virtual finish tag first), so a user's large or repeated
+    requests queue behind other users' instead of in front of them.
+    Raises AdmissionRejected (with retry_after seconds) when the user is over quota or the
+    queue is too long to finish within MAX_WAIT_SECONDS. Prepaid requests (batch rows
+    charged via charge_batch) skip the user quota and wait for their turn instead.
+    """
+    global _running, _running_cost, _virtual_time, _seconds_per_token
+
+    if not ENABLED:
+        yield
+        return
+
+    user = memory._normalize_user_key(user_name)
+    weight = WEIGHTS.get(user, 1.0)
+
+    with _cond:
+        now = time.time()
+        if not prepaid:
+            wait = _estimated_wait(cost)
+            if len(_waiting) >= MAX_QUEUE or wait > MAX_WAIT_SECONDS:
+                metrics.inc("admission_rejected_total", {"reason": "saturated"})
+                raise AdmissionRejected("The planner is busy. Please retry shortly.", max(wait - MAX_WAIT_SECONDS, 5))
+            _take_tokens(user, cost, now)
+
+        tag = max(_virtual_time, _last_finish.get(user, 0.0)) + cost / weight
+        _last_finish[user] = tag
+        seq = next(_seq)
+        heapq.heappush(_waiting, (tag, seq, user))
+        _waiting_cost[seq] = cost
+        metrics.set_gauge("admission_queue_depth", len(_waiting))
+
+        deadline = None if prepaid else time.monotonic() + MAX_WAIT_SECONDS
+        while _running >= _slots() or _waiting[0][1] != seq:
+            if deadline is None:
+                _cond.wait()
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _waiting.remove((tag, seq, user))
+                heapq.heapify(_waiting)
+                del _waiting_cost[seq]
+                _refund_tokens(user, cost)
+                metrics.set_gauge("admission_queue_depth", len(_waiting))
+                metrics.inc("admission_rejected_total", {"reason": "timeout"})
+                _cond.notify_all()
+                raise AdmissionRejected("The planner is busy. Please retry shortly.", _estimated_wait(cost))
+            _cond.wait(remaining)
+
+        heapq.heappop(_waiting)
+        del _waiting_cost[seq]
+        _virtual_time = tag
+        _running += 1
+        _running_cost += cost
+        metrics.set_gauge("admission_queue_depth", len(_waiting))
+        metrics.set_gauge("admission_running", _running)
+        metrics.observe("admission_wait_seconds", time.time() - now)
+
+    from modules import llm
+
+    started = time.perf_counter()
+    calls_before = llm.calls_on_thread()
+    completed = False
+    try:
+        yield
+        completed = True
+    finally:
+        elapsed = time.perf_counter() - started
+        with _cond:
+            _running -= 1
+            _running_cost -= cost
+            # Learn seconds per token only from blocks that finished real LLM work
+            if completed and cost > 0 and llm.calls_on_thread() > calls_before:
+                _seconds_per_token = 0.8 * _seconds_per_token + 0.2 * (elapsed / cost)
+            metrics.set_gauge("admission_running", _running)
+            _cond.notify_all()
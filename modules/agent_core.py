@@ -1,11 +1,16 @@
 import os
+import uuid
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 
 from modules import (
-    llm, pdf_parser, ocr, places, emailer, memory, cityinfo, season,
-    validator, place_photos, pdf_export
+    llm, places, memory, cityinfo, season,
+    validator, place_photos, plan_store, metrics, geo, token_stats
 )
 
+# pdf_parser (pdfminer), ocr (pytesseract/PIL), pdf_export (ReportLab) and emailer
+# are imported inside the functions that need them to keep CLI startup fast.
+
 SYSTEM_PROMPT = """You are an AI Travel Operations Agent.
 You output clean, human-readable itineraries or summaries.
 Never output JSON or code blocks unless explicitly asked.
@@ -13,8 +18,10 @@ You must follow formatting rules exactly.
 You must not invent place names: use ONLY the allowed place names provided.
 """
 
-def maybe_send_email(to_email: str | None, subject: str, body: str, attachments: list[str] | None = None):
+def maybe_send_email(to_email: str | None, subject: str, body: str, attachments: list | None = None):
     if to_email and to_email.strip():
+        from modules import emailer
+
         emailer.maybe_send_email(to_email.strip(), subject, body, attachments=attachments)
 
 def _build_dates(start_date: str, days: int) -> list[str]:
@@ -34,20 +41,77 @@ def _ensure_places_used(itinerary_text: str, allowed_names: list[str]) -> str:
     block = "\nPlaces Used:\n" + "\n".join([f"- {n}" for n in found]) + "\n"
     return itinerary_text.rstrip() + "\n" + block
 
+def _allowed_places_block(base_attractions: list[dict], allowed_names: list[str], days: int) -> str:
+    groups = geo.group_places_by_day(base_attractions, days)
+    if not groups:
+        lines = "\n".join([f"- {n}" for n in allowed_names])
+        return f"Allowed places (use ONLY these exact names):\n{lines}"
+
+    for day, group in enumerate(groups, start=1):
+        metrics.observe("plan_day_walk_km", group["walk_km"])
+    lines = "\n".join(
+        f"Day {day}: " + " | ".join(group["names"]) for day, group in enumerate(groups, start=1)
+    )
+    return (
+        "Allowed places by day (use ONLY these exact names; each day's places are close together, "
+        "visit them in the listed order):\n" + lines
+    )
+
+# num_predict bounds; within them the budget follows observed output lengths (token_stats)
+PLAN_MIN_PREDICT, PLAN_MAX_PREDICT = 300, 2200
+SUMMARIZE_MIN_PREDICT, SUMMARIZE_MAX_PREDICT = 160, 800
+# Planner prompt size assumed when it isn't built yet (admission cost estimates)
+PLAN_PROMPT_TOKENS = 900
+
+def plan_predict_ceiling(prompt_tokens: int = PLAN_PROMPT_TOKENS) -> int:
+    # Prompt and output must both fit in num_ctx, or Ollama drops the start of the prompt
+    room = llm.DEFAULT_OPTIONS["num_ctx"] - prompt_tokens
+    return max(PLAN_MIN_PREDICT, min(PLAN_MAX_PREDICT, room))
+
+def planner_num_predict(days: int, prompt_tokens: int = PLAN_PROMPT_TOKENS) -> int:
+    ceiling = plan_predict_ceiling(prompt_tokens)
+    # Until enough plans of this length were observed: scale with days to reduce truncation
+    default = min(ceiling, 350 + days * 330)
+    return token_stats.budget("plan", llm.OLLAMA_MODEL, days, default, PLAN_MIN_PREDICT, ceiling)
+
+def summarize_num_predict() -> int:
+    return token_stats.budget("summarize", llm.OLLAMA_MODEL, 0, 320, SUMMARIZE_MIN_PREDICT, SUMMARIZE_MAX_PREDICT)
+
+def _track_output(mode: str, days: int, data: dict, num_predict: int, fields: dict) -> tuple[str, bool]:
+    """
+    Returns (text, truncated). Every output length is recorded for future budgets;
+    hitting num_predict (done_reason == "length") is counted and logged.
+    """
+    truncated = data.get("done_reason") == "length"
+    token_stats.record(mode, llm.OLLAMA_MODEL, days, data.get("eval_count", 0), truncated)
+    fields.update(num_predict=num_predict, output_tokens=data.get("eval_count"), truncated=truncated)
+    if truncated:
+        metrics.inc("llm_truncated_total", {"mode": mode})
+        print(f"[llm] {mode} output truncated at num_predict={num_predict}")
+    return (data.get("message", {}).get("content", "") or "").strip(), truncated
+
 # ✅ add back for web_app import
 def get_user_history(user_name: str) -> list[dict]:
     return memory.load_trip_history(user_name)
 
-def summarize_file(input_path: str) -> str:
+@metrics.traced("summarize_file")
+def summarize_file(input_path: str, admit=None) -> str:
+    """`admit()` may return a context manager held around the LLM generation (admission control)."""
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"File not found: {input_path}")
 
     lower = input_path.lower()
     if lower.endswith(".pdf"):
-        raw_text = pdf_parser.extract_pdf_text(input_path)
+        from modules import pdf_parser
+
+        with metrics.span("pdf_extract"):
+            raw_text = pdf_parser.extract_pdf_text(input_path)
         source_type = "PDF booking document"
     elif lower.endswith((".png", ".jpg", ".jpeg", ".webp")):
-        raw_text = ocr.extract_image_text(input_path)
+        from modules import ocr
+
+        with metrics.span("ocr"):
+            raw_text = ocr.extract_image_text(input_path)
         source_type = "ticket screenshot or photo"
     else:
         raise ValueError("Unsupported file type. Use PDF or image.")
@@ -63,48 +127,92 @@ Task:
 Raw extracted text:
 {raw_text[:8000]}
 """
-    return llm.call_llm(SYSTEM_PROMPT, user_prompt, num_predict=320)
-
-def plan_trip(city: str, start_date: str, days: int, user_name: str, vibe: str = "", fast: bool = True):
-    info = cityinfo.get_city_info(city)
+    num_predict = summarize_num_predict()
+    session = llm.ChatSession(SYSTEM_PROMPT, user_prompt)
+    with admit() if admit else nullcontext():
+        with metrics.span("summarize_generate") as fields:
+            summary, truncated = _track_output("summarize", 0, session.ask(num_predict=num_predict), num_predict,
+                                               fields)
+        if truncated:
+            # One retry with room to finish (the prompt is already in the KV cache); a summary
+            # that still doesn't fit says so
+            num_predict = min(SUMMARIZE_MAX_PREDICT, int(num_predict * token_stats.TRUNCATED_GROWTH))
+            with metrics.span("summarize_generate", retry=True) as fields:
+                summary, truncated = _track_output("summarize", 0, session.ask(num_predict=num_predict),
+                                                   num_predict, fields)
+    if truncated:
+        summary += "\n\n(Summary truncated: output limit reached.)"
+    return summary
+
+def _season_block(runs: list[dict]) -> str:
+    if len(runs) == 1:
+        return f"Season notes: {runs[0]['label']} — {runs[0]['notes']}"
+    lines = "\n".join(
+        f"- Day {r['first_day']}–{r['last_day']} ({r['start']} to {r['end']}): {r['label']} — {r['notes']}"
+        for r in runs
+    )
+    return f"Season notes (the trip crosses seasons; follow the notes for each window):\n{lines}"
+
+def _reuse_stored_plan(city: str, dates: list[str], season_label: str, vibe: str, allowed_names: list[str],
+                       owner: str) -> str | None:
+    stored = plan_store.find_similar(city, len(dates), season_label, vibe, owner)
+    if not stored:
+        metrics.inc("plan_reuse_total", {"result": "miss"})
+        return None
+
+    itinerary = plan_store.redate_itinerary(stored["itinerary"], dates)
+    # Allowed places may have changed since the plan was stored
+    if validator.validate_itinerary(itinerary, allowed_names, len(dates)) != "OK":
+        metrics.inc("plan_reuse_total", {"result": "stale"})
+        return None
+    metrics.inc("plan_reuse_total", {"result": "hit"})
+    return itinerary
+
+@metrics.traced("plan_trip")
+def plan_trip(city: str, start_date: str, days: int, user_name: str, vibe: str = "", fast: bool = True,
+              reuse: bool = False, admit=None):
+    """
+    Returns (itinerary_text, base_attractions). With reuse=True a recent stored plan of the
+    same user for the same city, length, season and a similar vibe is re-dated and returned
+    instead of generating a new one. `admit()` may return a context manager held around the
+    LLM generation and auto-fix only (admission control), not the lookups or PDF work.
+    """
+    with metrics.span("geocode"):
+        info = cityinfo.get_city_info(city)
     if info is None:
         raise ValueError("City not found. Try 'City, Country' (e.g., 'Seoul, South Korea').")
 
-    season_profile = season.build_season_profile(info, start_date)
-    base_attractions = places.search_attractions(city, limit=8)
+    with metrics.span("season"):
+        season_runs = season.season_runs(info, start_date, days)
+    season_label = season.trip_season_label(season_runs)
+    with metrics.span("places"):
+        base_attractions = places.search_attractions(city, limit=8, vibe=vibe)
     allowed_names = [x.get("name", "") for x in base_attractions if x.get("name")]
-    allowed_block = "\n".join([f"- {n}" for n in allowed_names])
 
     dates = _build_dates(start_date, days)
 
+    owner = memory._normalize_user_key(user_name)
+    if reuse:
+        with metrics.span("plan_reuse_lookup"):
+            reused = _reuse_stored_plan(city, dates, season_label, vibe, allowed_names, owner)
+        if reused:
+            memory.append_trip_history(user_name, city, start_date, days, reused.splitlines()[0])
+            return reused, base_attractions
+
+    with metrics.span("day_clustering", places=len(allowed_names), days=days):
+        allowed_block = _allowed_places_block(base_attractions, allowed_names, days)
+
     history = memory.load_trip_history(user_name)[-5:]
     history_lines = [f"- {h.get('city')} ({h.get('start_date')}, {h.get('days')} days)" for h in history]
     history_block = "\n".join(history_lines) if history_lines else "(none)"
 
-    # Scale output length with days to reduce truncation
-    num_predict = min(2200, 350 + days * 330)
-
+    # Ordered from most to least shared (rules, city, vibe/places, dates, user) so plans for
+    # the same city reuse Ollama's cached prompt prefix
     prompt = f"""
 Mode: Planner
-User name: {user_name}
-User trip history (last 5):
-{history_block}
-
-Destination: {city}
-Travel dates: {dates}
-Season notes: {season_profile["label"]} — {season_profile["notes"]}
-
-User preferences (vibe):
-{vibe.strip() if vibe.strip() else "(none)"}
-
-Allowed places (use ONLY these exact names):
-{allowed_block}
-
-TASK:
-Generate an itinerary for EXACTLY {days} days.
 
 Hard Rules:
-- Output MUST contain Day 1 through Day {days}. No missing days.
+- Output MUST contain every day from Day 1 through the last requested day. No missing days.
 - Each day MUST have Morning / Afternoon / Evening.
 - Use ONLY allowed place names (exact spelling).
 - End with:
@@ -117,35 +225,77 @@ Day 1 – YYYY-MM-DD
 - Morning: ...
 - Afternoon: ...
 - Evening: ...
+
+Destination: {city}
+
+User preferences (vibe):
+{vibe.strip() if vibe.strip() else "(none)"}
+
+{allowed_block}
+
+Travel dates: {dates}
+{_season_block(season_runs)}
+
+User name: {user_name}
+User trip history (last 5):
+{history_block}
+
+TASK:
+Generate an itinerary for EXACTLY {days} days (Day 1 through Day {days}).
 """.strip()
 
+    # Attempts re-ask the same prefix and auto-fix continues the chat, so Ollama only
+    # evaluates the new tokens instead of the whole planner prompt each time
+    session = llm.ChatSession(SYSTEM_PROMPT, prompt)
+    prompt_tokens = llm.estimate_tokens(session.prefix)
+    num_predict = planner_num_predict(days, prompt_tokens)
     last = ""
-    for _attempt in range(3):
-        itinerary = llm.call_llm(SYSTEM_PROMPT, prompt, num_predict=num_predict).strip()
-        itinerary = _ensure_places_used(itinerary, allowed_names)
+    valid = False
+    with admit() if admit else nullcontext():
+        for attempt in range(3):
+            metrics.inc("plan_attempts_total")
+            with metrics.span("plan_generate", attempt=attempt + 1, days=days) as fields:
+                itinerary, truncated = _track_output("plan", days, session.ask(num_predict=num_predict),
+                                                     num_predict, fields)
+            if truncated:
+                # A cut-off itinerary is never validated, accepted or stored; retry with a larger budget
+                num_predict = min(plan_predict_ceiling(prompt_tokens), int(num_predict * token_stats.TRUNCATED_GROWTH))
+                last = itinerary
+                continue
+            itinerary = _ensure_places_used(itinerary, allowed_names)
+
+            with metrics.span("validate"):
+                verdict = validator.validate_itinerary(itinerary, allowed_names, days)
+            if verdict == "OK":
+                last = itinerary
+                valid = True
+                break
+
+            with metrics.span("auto_fix", attempt=attempt + 1):
+                fixed = validator.auto_fix_itinerary(itinerary, allowed_names, days=days, num_predict=num_predict,
+                                                     session=session)
+            metrics.inc("plan_autofix_total", {"outcome": "fixed" if fixed else "failed"})
+            if fixed:
+                last = fixed
+                valid = True
+                break
 
-        if validator.validate_itinerary(itinerary, allowed_names, days) == "OK":
             last = itinerary
-            break
-
-        fixed = validator.auto_fix_itinerary(itinerary, allowed_names, days=days)
-        if fixed:
-            last = fixed
-            break
-
-        last = itinerary
 
     if last.strip().upper().startswith("FIX:"):
         raise RuntimeError("LLM output invalid after retries (returned FIX). Try again or reduce days/vibe length.")
 
+    if valid:
+        plan_store.save_plan(city, start_date, days, season_label, vibe, last, owner)
+    elif truncated:
+        last += "\n\n(Itinerary truncated: output limit reached.)"
+
     first_line = last.splitlines()[0] if last else ""
     memory.append_trip_history(user_name, city, start_date, days, first_line)
 
     return last, base_attractions
 
-def export_plan_pdf(city: str, start_date: str, days: int, user_name: str, vibe: str, fast: bool):
-    itinerary_text, base_attractions = plan_trip(city, start_date, days, user_name, vibe, fast=fast)
-
+def _collect_photos(itinerary_text: str, base_attractions: list[dict]) -> tuple[list[tuple], list[str]]:
     used = validator.extract_places_used(itinerary_text)
     if not used:
         allowed_names = [x.get("name", "") for x in base_attractions if x.get("name")]
@@ -161,28 +311,47 @@ def export_plan_pdf(city: str, start_date: str, days: int, user_name: str, vibe:
         if not name or name.lower() not in used_lower:
             continue
 
-        photos = item.get("photos") or []
-        if not photos:
-            continue
-
-        photo_ref = photos[0].get("photo_reference")
+        photo_ref = item.get("photo_ref")
         if not photo_ref:
             continue
 
-        img_path = place_photos.download_photo(photo_ref, name, max_width=900)
+        with metrics.span("photo_download", place=name):
+            img_path = place_photos.download_photo(photo_ref, name, max_width=900)
         if img_path:
-            images.append((name, img_path))
+            images.append((name, img_path, place_photos.photo_size(img_path)))
 
-        ha = photos[0].get("html_attributions") if isinstance(photos[0], dict) else None
+        ha = item.get("photo_attribution")
         if ha:
-            attributions.append(f"{name}: {str(ha)[:300]}")
+            attributions.append(f"{name}: {ha}")
 
         if len(images) >= 6:
             break
 
+    return images, attributions
+
+def _pdf_filename(city: str, start_date: str, days: int) -> str:
     safe_city = "".join([c for c in city if c.isalnum() or c in ("_", "-", " ")])[:40].strip().replace(" ", "_")
-    filename = f"{safe_city}_{start_date}_{days}d.pdf"
+    # Timestamp + random suffix: exports for the same city/date/days must not overwrite each other
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return f"{safe_city}_{start_date}_{days}d_{stamp}_{uuid.uuid4().hex[:6]}.pdf"
+
+@metrics.traced("export_plan_pdf")
+def export_plan_pdf(city: str, start_date: str, days: int, user_name: str, vibe: str, fast: bool,
+                    in_memory: bool = False, reuse: bool = False, admit=None):
+    """
+    Returns (pdf_path, itinerary_text). With in_memory=True nothing is written to disk and the
+    first element is the PDF filename, retrievable via pdf_export.get_memory_pdf.
+    """
+    from modules import pdf_export
+
+    itinerary_text, base_attractions = plan_trip(city, start_date, days, user_name, vibe, fast=fast, reuse=reuse,
+                                                 admit=admit)
+    images, attributions = _collect_photos(itinerary_text, base_attractions)
+
+    filename = _pdf_filename(city, start_date, days)
     title = f"{days}-Day Itinerary — {city} (from {start_date})"
 
-    pdf_path = pdf_export.export_itinerary_pdf(filename, title, itinerary_text, images, attributions)
+    with metrics.span("pdf_render", images=len(images)):
+        pdf_path = pdf_export.export_itinerary_pdf(filename, title, itinerary_text, images, attributions,
+                                                   in_memory=in_memory)
     return pdf_path, itinerary_text
@@ -0,0 +1,272 @@
+import os
+import sys
+import csv
+import io
+import json
+import time
+import uuid
+import queue
+import threading
+import zipfile
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from modules import cityinfo, places, metrics, config
+
+BATCH_DIR = os.path.join(config.BASE_DIR, "exports", "batches")
+
+REPORT_FIELDS = ["row", "city", "start", "days", "user", "vibe", "status", "pdf", "pages", "seconds", "error"]
+
+
+def _parse_row(n: int, raw: dict) -> dict:
+    row = {k.strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in raw.items() if k}
+    city = row.get("city") or ""
+    start = row.get("start") or row.get("start_date") or ""
+    if not city or not start or not row.get("days"):
+        raise ValueError("city, start and days are required")
+    try:
+        datetime.strptime(str(start), "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"start must be YYYY-MM-DD, got {start!r}")
+    days = int(row["days"])
+    if days < 1:
+        raise ValueError("days must be at least 1")
+    return {
+        "row": n,
+        "city": city,
+        "start": str(start),
+        "days": days,
+        "user": row.get("user") or row.get("user_name") or "default",
+        "vibe": row.get("vibe") or "",
+    }
+
+
+def load_manifest(path: str) -> list[dict]:
+    """
+    Reads a .csv (header: city,start,days[,user,vibe]) or .jsonl manifest.
+    Rows that fail to parse are returned with an "error" key instead of being dropped.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Manifest not found: {path}")
+
+    lower = path.lower()
+    with open(path, "r", encoding="utf-8-sig") as f:
+        if lower.endswith(".csv"):
+            raw_rows = list(csv.DictReader(f))
+        elif lower.endswith((".jsonl", ".ndjson")):
+            raw_rows = []
+            for line in f:
+                if line.strip():
+                    try:
+                        raw_rows.append(json.loads(line))
+                    except json.JSONDecodeError as e:
+                        raw_rows.append({"_error": f"invalid JSON: {e}"})
+        else:
+            raise ValueError("Unsupported manifest type. Use .csv or .jsonl.")
+
+    return parse_rows(raw_rows)
+
+
+def parse_rows(raw_rows: list) -> list[dict]:
+    rows = []
+    for n, raw in enumerate(raw_rows, start=1):
+        try:
+            if not isinstance(raw, dict) or "_error" in raw:
+                raise ValueError(raw.get("_error") if isinstance(raw, dict) else "row is not an object")
+            rows.append(_parse_row(n, raw))
+        except (ValueError, TypeError) as e:
+            rows.append({"row": n, "city": (raw.get("city") if isinstance(raw, dict) else "") or "",
+                         "error": str(e)})
+    return rows
+
+
+def _prefetch(rows: list[dict], workers: int) -> None:
+    # One geocode per city and one Places lookup per (city, vibe); every row of the batch then
+    # hits the caches instead of the APIs. Photos are fetched after planning, only for the places
+    # an itinerary uses (cached per photo_ref, so rows still share them).
+    cities = {r["city"] for r in rows}
+    searches = {(r["city"], r["vibe"]) for r in rows}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for city, fut in [(c, pool.submit(cityinfo.get_city_info, c)) for c in cities]:
+            try:
+                fut.result()
+            except Exception as e:
+                print(f"[batch] Geocode failed for {city}: {e}", file=sys.stderr)
+
+        for (city, vibe), fut in [(s, pool.submit(places.search_attractions, s[0], 8, None, s[1])) for s in searches]:
+            try:
+                fut.result()
+            except Exception as e:
+                print(f"[batch] Places lookup failed for {city}: {e}", file=sys.stderr)
+
+    print(f"[batch] Prefetched {len(cities)} cities, {len(searches)} place searches", file=sys.stderr)
+
+
+def _plan_row(row: dict, fast: bool, reuse: bool) -> tuple:
+    from modules import agent_core
+
+    started = time.perf_counter()
+    itinerary, base_attractions = agent_core.plan_trip(
+        row["city"], row["start"], row["days"], row["user"], row["vibe"], fast=fast, reuse=reuse
+    )
+    images, attributions = agent_core._collect_photos(itinerary, base_attractions)
+    filename = agent_core._pdf_filename(row["city"], row["start"], row["days"])
+    title = f"{row['days']}-Day Itinerary — {row['city']} (from {row['start']})"
+    return filename, title, itinerary, images, attributions, time.perf_counter() - started
+
+
+def _render_pdf(title: str, itinerary_text: str, images: list, attributions: list) -> tuple[bytes, int]:
+    # Runs in a worker process
+    from modules import pdf_export
+
+    return pdf_export.render_itinerary_pdf(title, itinerary_text, images, attributions)
+
+
+def _report_csv(report: list[dict]) -> str:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for entry in report:
+        writer.writerow(entry)
+    return buf.getvalue()
+
+
+@metrics.traced("export_pdf_batch")
+def export_pdf_batch(manifest_path: str, fast: bool = True, workers: int = 0, processes: int = 0,
+                     reuse: bool = False) -> tuple[str, list[dict]]:
+    """
+    Plans every manifest row and renders the PDFs on a process pool.
+    Returns (zip_path, report); the zip holds the PDFs plus report.csv.
+    workers = concurrent plan_trip calls (default: the Ollama concurrency limit),
+    processes = ReportLab worker processes (default: CPU count).
+    """
+    from modules import llm
+
+    rows = load_manifest(manifest_path)
+    valid = [r for r in rows if "error" not in r]
+    workers = workers or llm.concurrency_limit()
+    processes = processes or min(len(valid) or 1, os.cpu_count() or 1)
+
+    report = {r["row"]: {**r, "status": "error" if "error" in r else "pending"} for r in rows}
+    zip_name = f"batch_{datetime.now().strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:6]}.zip"
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    zip_path = os.path.join(BATCH_DIR, zip_name)
+
+    with metrics.span("batch_prefetch", rows=len(valid)):
+        _prefetch(valid, max(4, workers))
+
+    # Planning (LLM-bound) runs on threads; each finished plan is handed straight to the
+    # render pool so ReportLab work overlaps with the remaining LLM calls.
+    ctx = multiprocessing.get_context("spawn")
+    with ThreadPoolExecutor(max_workers=workers) as planners, \
+            ProcessPoolExecutor(max_workers=processes, mp_context=ctx) as renderers, \
+            zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        planned = {planners.submit(_plan_row, r, fast, reuse): r for r in valid}
+        rendering = {}
+        for fut in as_completed(planned):
+            row = planned[fut]
+            try:
+                filename, title, itinerary, images, attributions, seconds = fut.result()
+            except Exception as e:
+                report[row["row"]].update(status="error", error=str(e))
+                print(f"[batch] Row {row['row']} ({row['city']}) failed: {e}", file=sys.stderr)
+                continue
+            report[row["row"]].update(pdf=filename, seconds=round(seconds, 2))
+            rendering[renderers.submit(_render_pdf, title, itinerary, images, attributions)] = row
+
+        for fut in as_completed(rendering):
+            entry = report[rendering[fut]["row"]]
+            try:
+                data, pages = fut.result()
+            except Exception as e:
+                entry.update(status="error", error=f"PDF render failed: {e}")
+                continue
+            zf.writestr(entry["pdf"], data)
+            entry.update(status="ok", pages=pages)
+
+        ordered = [report[n] for n in sorted(report)]
+        zf.writestr("report.csv", _report_csv(ordered))
+
+    for entry in ordered:
+        metrics.inc("batch_rows_total", {"status": entry["status"]})
+    return zip_path, ordered
+
+
+def _group_by_city(rows: list[dict]) -> list[list[dict]]:
+    # Largest groups first; inside a group, rows sharing vibe and length are adjacent so
+    # consecutive prompts share the longest prefix
+    groups: dict[str, list[dict]] = {}
+    for r in rows:
+        groups.setdefault(" ".join(r["city"].lower().split()), []).append(r)
+    ordered = sorted(groups.values(), key=len, reverse=True)
+    return [sorted(g, key=lambda r: (r["vibe"].lower(), r["days"], r["start"])) for g in ordered]
+
+
+def _plan_result(row: dict, fast: bool, admit, reuse: bool) -> dict:
+    from modules import agent_core
+
+    result = {k: row[k] for k in ("row", "city", "start", "days", "user", "vibe")}
+    started = time.perf_counter()
+    try:
+        itinerary, _ = agent_core.plan_trip(row["city"], row["start"], row["days"], row["user"], row["vibe"],
+                                            fast=fast, reuse=reuse, admit=(lambda: admit(row)) if admit else None)
+        result.update(status="ok", itinerary=itinerary)
+    except Exception as e:
+        result.update(status="error", error=str(e))
+        retry_after = getattr(e, "retry_after", None)
+        if retry_after:
+            result["retry_after"] = retry_after
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    metrics.inc("batch_rows_total", {"status": result["status"]})
+    return result
+
+
+def _plan_group(group: list[dict], fast: bool, admit, reuse: bool, results: queue.Queue,
+                stop: threading.Event) -> None:
+    from modules import llm
+
+    # One worker plans a whole city on one backend, reusing the cached city prefix
+    with llm.sticky_backend():
+        for row in group:
+            if stop.is_set():
+                return
+            results.put(_plan_result(row, fast, admit, reuse))
+
+
+def plan_batch(rows: list[dict], fast: bool = True, workers: int = 0, admit=None, reuse: bool = False):
+    """
+    Plans parsed manifest rows and yields one result dict per row as soon as it is done
+    (invalid rows first). Lookups are deduplicated up front; city groups are spread over
+    `workers` threads (default: the Ollama concurrency limit). `admit(row)` may return a
+    context manager held around each row's LLM generation (the web app passes admission control).
+    """
+    from modules import llm
+
+    valid = [r for r in rows if "error" not in r]
+    for r in rows:
+        if "error" in r:
+            metrics.inc("batch_rows_total", {"status": "error"})
+            yield {"row": r["row"], "city": r.get("city", ""), "status": "error", "error": r["error"]}
+    if not valid:
+        return
+
+    workers = workers or llm.concurrency_limit()
+    with metrics.span("batch_prefetch", rows=len(valid)):
+        _prefetch(valid, max(4, workers))
+
+    results: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [pool.submit(_plan_group, g, fast, admit, reuse, results, stop) for g in _group_by_city(valid)]
+        for _ in valid:
+            yield results.get()
+        for fut in futures:
+            fut.result()
+    finally:
+        # The consumer may stop early (client disconnected): drop groups not started yet and
+        # stop running groups before their next row
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
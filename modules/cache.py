@@ -1,35 +1,82 @@
 import os
 import json
 import time
+import threading
 from typing import Any
 
+from modules import metrics
+
 CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "cache.json")
 
+# Serializes read-modify-write cycles (Places sub-queries and photo downloads run concurrently)
+_write_lock = threading.Lock()
+
+# (stamp, parsed cache file), reused until the file's (path, mtime, size) changes; always replaced
+# with one assignment so concurrent readers and writers never pair a stamp with other data
+_memo: tuple = (None, {})
+
+def _stamp():
+    try:
+        st = os.stat(CACHE_PATH)
+    except OSError:
+        return None
+    return CACHE_PATH, st.st_mtime_ns, st.st_size
+
 def _load() -> dict:
-    if not os.path.exists(CACHE_PATH):
+    global _memo
+    stamp = _stamp()
+    if stamp is None:
         return {}
+    memo_stamp, memo_data = _memo
+    if stamp == memo_stamp:
+        return memo_data
     try:
         with open(CACHE_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+            data = json.load(f)
     except Exception:
         return {}
+    _memo = (stamp, data)
+    return data
 
 def _save(data: dict) -> None:
+    global _memo
     os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
-    with open(CACHE_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Write to a temp file and swap it in so readers never see a half-written cache
+    tmp_path = f"{CACHE_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, CACHE_PATH)
+    _memo = (_stamp(), data)
 
 def cache_get(key: str, max_age_seconds: int) -> Any | None:
+    namespace = key.split(":", 1)[0]
     data = _load()
     item = data.get(key)
     if not item:
+        metrics.inc("cache_requests_total", {"namespace": namespace, "result": "miss"})
         return None
     ts = item.get("ts", 0)
     if time.time() - ts > max_age_seconds:
+        metrics.inc("cache_requests_total", {"namespace": namespace, "result": "expired"})
         return None
+    metrics.inc("cache_requests_total", {"namespace": namespace, "result": "hit"})
     return item.get("value")
 
-def cache_set(key: str, value: Any) -> None:
-    data = _load()
-    data[key] = {"ts": time.time(), "value": value}
-    _save(data)
+def cache_set(key: str, value: Any, ts: float | None = None) -> None:
+    # ts lets callers rewrite an entry in place (e.g. a schema upgrade) without extending its age
+    with _write_lock:
+        data = dict(_load())
+        data[key] = {"ts": time.time() if ts is None else ts, "value": value}
+        _save(data)
+
+def cache_get_entry(key: str) -> dict | None:
+    return _load().get(key)
+
+def cache_migrate(migrate) -> bool:
+    """Runs migrate(data) on a copy of the whole cache under the write lock; saves if it returns True."""
+    with _write_lock:
+        data = dict(_load())
+        if not migrate(data):
+            return False
+        _save(data)
+        return True
@@ -1,10 +1,22 @@
+import os
 import requests
 
+from modules import config  # noqa: F401 - loads config/.env
+from modules.cache import cache_get, cache_set
+
+GEOCODING_URL = os.getenv("GEOCODING_URL", "https://geocoding-api.open-meteo.com/v1/search")
+
+CACHE_MAX_AGE = 30 * 24 * 3600
+
 def get_city_info(city: str):
-    url = "https://geocoding-api.open-meteo.com/v1/search"
+    cache_key = f"geocode:{city.strip().lower()}"
+    cached = cache_get(cache_key, max_age_seconds=CACHE_MAX_AGE)
+    if cached:
+        return cached
+
     params = {"name": city, "count": 1}
 
-    resp = requests.get(url, params=params, timeout=10)
+    resp = requests.get(GEOCODING_URL, params=params, timeout=10)
     resp.raise_for_status()
     data = resp.json()
 
@@ -16,7 +28,7 @@ def get_city_info(city: str):
     lat = item["latitude"]
     hemisphere = "Northern" if lat >= 0 else "Southern"
 
-    return {
+    info = {
         "city": item.get("name", city),
         "country": item.get("country", "Unknown"),
         "latitude": lat,
@@ -24,3 +36,5 @@ def get_city_info(city: str):
         "hemisphere": hemisphere,
         "timezone": item.get("timezone", "Unknown"),
     }
+    cache_set(cache_key, info)
+    return info
@@ -0,0 +1,19 @@
+import os
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # /app
+ENV_PATH = os.path.join(BASE_DIR, "config", ".env")
+
+_loaded = False
+
+
+def load() -> None:
+    # Single place that reads config/.env; every module importing config gets it loaded once
+    global _loaded
+    if _loaded:
+        return
+    load_dotenv(ENV_PATH)
+    _loaded = True
+
+
+load()
@@ -5,63 +5,111 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
-from dotenv import load_dotenv
 
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # /app
-load_dotenv(os.path.join(BASE_DIR, "config", ".env"))
+from modules import config  # noqa: F401 - loads config/.env
 
-def send_email(
-    to_email: str,
-    subject: str,
-    body: str,
-    attachments: list[str] | None = None,
-) -> None:
+SMTP_TIMEOUT = 25
+
+def smtp_settings() -> dict | None:
     smtp_host = os.getenv("SMTP_HOST")
     smtp_port = os.getenv("SMTP_PORT")
     smtp_user = os.getenv("SMTP_USER")
     smtp_pass = os.getenv("SMTP_PASS")
     from_email = os.getenv("EMAIL_FROM") or os.getenv("FROM_EMAIL") or smtp_user
+    # SMTP_STARTTLS=0 with empty credentials allows a plain local SMTP server (e.g. for tests)
+    starttls = os.getenv("SMTP_STARTTLS", "1").strip().lower() not in ("0", "false", "no")
 
-    if not all([smtp_host, smtp_port, smtp_user, smtp_pass, from_email]):
-        print("[email] SMTP not configured. Skipping email send.")
-        return
+    if not all([smtp_host, smtp_port, from_email]):
+        return None
+    if starttls and not all([smtp_user, smtp_pass]):
+        return None
 
+    return {
+        "host": smtp_host,
+        "port": int(smtp_port),
+        "user": smtp_user,
+        "password": smtp_pass,
+        "from_email": from_email,
+        "starttls": starttls,
+    }
+
+def open_smtp_connection(settings: dict) -> smtplib.SMTP:
+    server = smtplib.SMTP(settings["host"], settings["port"], timeout=SMTP_TIMEOUT)
+    try:
+        server.ehlo()
+        if settings["starttls"]:
+            server.starttls()
+            server.ehlo()
+        if settings["user"] and settings["password"]:
+            server.login(settings["user"], settings["password"])
+    except Exception:
+        server.close()
+        raise
+    return server
+
+def build_message(
+    from_email: str,
+    to_email: str,
+    subject: str,
+    body: str,
+    attachments: list | None = None,
+) -> MIMEMultipart:
     msg = MIMEMultipart()
     msg["From"] = from_email
     msg["To"] = to_email
     msg["Subject"] = subject
     msg.attach(MIMEText(body, "plain", "utf-8"))
 
+    # Each attachment is a file path or an in-memory (filename, bytes) pair
     attachments = attachments or []
-    for path in attachments:
-        if not path or not os.path.exists(path):
-            print(f"[email] Attachment missing: {path}")
-            continue
+    for item in attachments:
+        if isinstance(item, tuple):
+            filename, payload = item
+        else:
+            if not item or not os.path.exists(item):
+                print(f"[email] Attachment missing: {item}")
+                continue
+            filename = os.path.basename(item)
+            with open(item, "rb") as f:
+                payload = f.read()
 
-        ctype, encoding = mimetypes.guess_type(path)
+        ctype, encoding = mimetypes.guess_type(filename)
         if ctype is None or encoding is not None:
             ctype = "application/octet-stream"
         maintype, subtype = ctype.split("/", 1)
 
-        with open(path, "rb") as f:
-            part = MIMEBase(maintype, subtype)
-            part.set_payload(f.read())
-            encoders.encode_base64(part)
-            part.add_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
-            msg.attach(part)
+        part = MIMEBase(maintype, subtype)
+        part.set_payload(payload)
+        encoders.encode_base64(part)
+        part.add_header("Content-Disposition", f'attachment; filename="{filename}"')
+        msg.attach(part)
+
+    return msg
+
+def send_email(
+    to_email: str,
+    subject: str,
+    body: str,
+    attachments: list | None = None,
+) -> None:
+    settings = smtp_settings()
+    if settings is None:
+        print("[email] SMTP not configured. Skipping email send.")
+        return
+
+    msg = build_message(settings["from_email"], to_email, subject, body, attachments)
 
     try:
-        with smtplib.SMTP(smtp_host, int(smtp_port), timeout=25) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(smtp_user, smtp_pass)
+        with open_smtp_connection(settings) as server:
             server.send_message(msg)
         print(f"[email] Email sent to {to_email}")
     except Exception as e:
         print(f"[email] Failed to send email: {e}")
 
-def maybe_send_email(to_email: str, subject: str, body: str, attachments: list[str] | None = None) -> None:
+def maybe_send_email(to_email: str, subject: str, body: str, attachments: list | None = None) -> None:
     if not to_email or not to_email.strip():
         return
-    send_email(to_email.strip(), subject, body, attachments=attachments)
+
+    from modules import outbox
+
+    outbox.enqueue(to_email.strip(), subject, body, attachments=attachments)
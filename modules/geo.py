@@ -0,0 +1,95 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def distance_matrix(points: list[tuple[float, float]]) -> list[list[float]]:
+    """
+    Pairwise haversine distances in km. Trig terms are computed once per point,
+    so each pair costs only a few multiplications.
+    """
+    lat = [math.radians(p[0]) for p in points]
+    lng = [math.radians(p[1]) for p in points]
+    cos_lat = [math.cos(x) for x in lat]
+    n = len(points)
+
+    dist = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            a = math.sin((lat[j] - lat[i]) / 2) ** 2 + cos_lat[i] * cos_lat[j] * math.sin((lng[j] - lng[i]) / 2) ** 2
+            d = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+            dist[i][j] = dist[j][i] = d
+    return dist
+
+
+def _assign_balanced(dist: list[list[float]], medoids: list[int]) -> list[list[int]]:
+    # Nearest medoid first, but no cluster may exceed ceil(n/k) so days stay comparable
+    n, k = len(dist), len(medoids)
+    capacity = math.ceil(n / k)
+    clusters: list[list[int]] = [[m] for m in medoids]
+    pairs = sorted(
+        (dist[p][m], p, ci) for p in range(n) if p not in medoids for ci, m in enumerate(medoids)
+    )
+    assigned = set(medoids)
+    for _, p, ci in pairs:
+        if p in assigned or len(clusters[ci]) >= capacity:
+            continue
+        clusters[ci].append(p)
+        assigned.add(p)
+    return clusters
+
+
+def k_medoids(dist: list[list[float]], k: int, max_iter: int = 20) -> list[list[int]]:
+    n = len(dist)
+    k = max(1, min(k, n))
+
+    # Deterministic init: most central point, then repeatedly the point farthest from all medoids
+    medoids = [min(range(n), key=lambda i: sum(dist[i]))]
+    while len(medoids) < k:
+        medoids.append(max(
+            (i for i in range(n) if i not in medoids),
+            key=lambda i: min(dist[i][m] for m in medoids),
+        ))
+
+    clusters = _assign_balanced(dist, medoids)
+    for _ in range(max_iter):
+        new_medoids = [min(c, key=lambda i: sum(dist[i][j] for j in c)) for c in clusters]
+        if new_medoids == medoids:
+            break
+        medoids = new_medoids
+        clusters = _assign_balanced(dist, medoids)
+    return clusters
+
+
+def walking_route(dist: list[list[float]], members: list[int]) -> tuple[list[int], float]:
+    # Nearest-neighbour tour through the cluster, starting at its first member (the medoid)
+    if not members:
+        return [], 0.0
+    route = [members[0]]
+    remaining = set(members[1:])
+    total = 0.0
+    while remaining:
+        nxt = min(remaining, key=lambda j: dist[route[-1]][j])
+        total += dist[route[-1]][nxt]
+        route.append(nxt)
+        remaining.remove(nxt)
+    return route, total
+
+
+def group_places_by_day(places: list[dict], days: int) -> list[dict] | None:
+    """
+    Splits places into one geographic bucket per day.
+    Returns [{"names": [...], "walk_km": float}, ...] (len == days), or None when
+    coordinates are missing. With more days than places, buckets are reused in order.
+    """
+    located = [p for p in places if p.get("name") and p.get("lat") is not None and p.get("lng") is not None]
+    if len(located) < 2 or len(located) < len([p for p in places if p.get("name")]):
+        return None
+
+    dist = distance_matrix([(p["lat"], p["lng"]) for p in located])
+    buckets = []
+    for members in k_medoids(dist, days):
+        route, km = walking_route(dist, members)
+        buckets.append({"names": [located[i]["name"] for i in route], "walk_km": round(km, 2)})
+
+    return [buckets[d % len(buckets)] for d in range(days)]
@@ -1,13 +1,24 @@
 import os
+import time
+import threading
 import requests
-from dotenv import load_dotenv
+from contextlib import contextmanager
 
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # /app
-load_dotenv(os.path.join(BASE_DIR, "config", ".env"))
+from modules import config, metrics  # noqa: F401 - config loads config/.env
 
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://ollama:11434").rstrip("/")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
 
+# Comma-separated list of Ollama backends; falls back to the single OLLAMA_HOST
+OLLAMA_HOSTS = [h.strip().rstrip("/") for h in os.getenv("OLLAMA_HOSTS", "").split(",") if h.strip()] or [OLLAMA_HOST]
+# Requests each backend runs at once (Ollama's OLLAMA_NUM_PARALLEL)
+OLLAMA_NUM_PARALLEL = max(1, int(os.getenv("OLLAMA_NUM_PARALLEL", "1")))
+HEALTH_CHECK_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))
+FAIL_COOLDOWN_SECONDS = 10
+FAIL_COOLDOWN_MAX_SECONDS = 300
+# A backend with the model already loaded wins unless it has this many more requests in flight
+AFFINITY_SLACK = 1
+
 DEFAULT_OPTIONS = {
     "temperature": 0.35,
     "top_p": 0.9,
@@ -15,28 +26,331 @@ DEFAULT_OPTIONS = {
     "num_ctx": 4096,
 }
 
-def call_llm(system_prompt: str, user_prompt: str, *, num_predict: int | None = None) -> str:
-    url = f"{OLLAMA_HOST}/api/chat"
+
+def _model_names(name: str) -> set[str]:
+    return {name, name.split(":", 1)[0]} if name.endswith(":latest") else {name}
+
+
+class Backend:
+    def __init__(self, host: str):
+        self.host = host
+        self.outstanding = 0
+        self.healthy = True
+        self.down_until = 0.0
+        self.consecutive_failures = 0
+        self.loaded_models: set[str] = set()
+        self.ewma_latency: float | None = None
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        return self.healthy or now >= self.down_until
+
+    def mark_down(self, now: float) -> None:
+        self.consecutive_failures += 1
+        self.failures += 1
+        self.healthy = False
+        cooldown = min(FAIL_COOLDOWN_MAX_SECONDS, FAIL_COOLDOWN_SECONDS * 2 ** (self.consecutive_failures - 1))
+        self.down_until = now + cooldown
+        metrics.set_gauge("llm_backend_healthy", 0, {"backend": self.host})
+
+    def mark_up(self) -> None:
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.down_until = 0.0
+        metrics.set_gauge("llm_backend_healthy", 1, {"backend": self.host})
+
+    def stats(self) -> dict:
+        return {
+            "host": self.host,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ewma_latency_s": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "loaded_models": sorted(self.loaded_models),
+        }
+
+
+_backends = [Backend(h) for h in OLLAMA_HOSTS]
+_pool_lock = threading.Lock()
+_health_thread: threading.Thread | None = None
+_local = threading.local()
+
+
+def concurrency_limit() -> int:
+    return len(_backends) * OLLAMA_NUM_PARALLEL
+
+
+@contextmanager
+def sticky_backend():
+    """
+    Sessions started in this block (on this thread) continue on the backend the previous
+    one used, so consecutive prompts with a shared prefix hit the same KV cache.
+    """
+    previous = getattr(_local, "sticky", None)
+    _local.sticky = {"host": None}
+    try:
+        yield
+    finally:
+        _local.sticky = previous
+
+
+def calls_on_thread() -> int:
+    """Completed chat calls made by the current thread (admission control times LLM work with it)."""
+    return getattr(_local, "calls", 0)
+
+
+def backend_stats() -> list[dict]:
+    with _pool_lock:
+        return [b.stats() for b in _backends]
+
+
+def _acquire_backend(model: str, exclude: set[str], prefer: str | None = None) -> Backend | None:
+    now = time.time()
+    with _pool_lock:
+        candidates = [b for b in _backends if b.host not in exclude and b.available(now)]
+        if not candidates:
+            # Everything is cooling down: still try the rest rather than failing outright
+            candidates = [b for b in _backends if b.host not in exclude]
+        if not candidates:
+            return None
+        # Sessions stick to the backend that holds their KV cache while it is usable
+        pinned = [b for b in candidates if b.host == prefer and b.healthy]
+        if pinned:
+            candidates = pinned
+
+        def score(b: Backend):
+            warm = model in b.loaded_models
+            return (
+                b.outstanding - (AFFINITY_SLACK if warm else 0),
+                0 if warm else 1,
+                b.ewma_latency if b.ewma_latency is not None else 0.0,
+            )
+
+        best = min(candidates, key=score)
+        best.outstanding += 1
+        best.requests += 1
+        metrics.set_gauge("llm_backend_outstanding", best.outstanding, {"backend": best.host})
+        return best
+
+
+def _release_backend(backend: Backend, model: str, *, latency: float | None = None, failed: bool = False,
+                     errored: bool = False, model_missing: bool = False) -> None:
+    # failed: unreachable (cool down); errored: it answered with an error, so neither its
+    # health nor its loaded models are known from this request
+    with _pool_lock:
+        backend.outstanding -= 1
+        metrics.set_gauge("llm_backend_outstanding", backend.outstanding, {"backend": backend.host})
+        if failed:
+            backend.mark_down(time.time())
+            return
+        if errored:
+            backend.failures += 1
+            if model_missing:
+                backend.loaded_models -= _model_names(model)
+            return
+        backend.mark_up()
+        backend.loaded_models |= _model_names(model)
+        if latency is not None:
+            backend.ewma_latency = latency if backend.ewma_latency is None else 0.8 * backend.ewma_latency + 0.2 * latency
+
+
+def _check_backend(backend: Backend) -> None:
+    try:
+        resp = requests.get(f"{backend.host}/api/ps", timeout=3)
+        resp.raise_for_status()
+        loaded = set()
+        for m in resp.json().get("models", []) or []:
+            loaded |= _model_names(m.get("name", ""))
+    except Exception:
+        with _pool_lock:
+            now = time.time()
+            if backend.healthy:
+                backend.mark_down(now)
+            else:
+                backend.down_until = max(backend.down_until, now + HEALTH_CHECK_INTERVAL)
+        return
+
+    with _pool_lock:
+        backend.mark_up()
+        backend.loaded_models = loaded
+
+
+def _health_loop() -> None:
+    while True:
+        for backend in list(_backends):
+            _check_backend(backend)
+        time.sleep(HEALTH_CHECK_INTERVAL)
+
+
+def _ensure_health_checks() -> None:
+    global _health_thread
+    if len(_backends) < 2 or HEALTH_CHECK_INTERVAL <= 0:
+        return
+    with _pool_lock:
+        if _health_thread is not None and _health_thread.is_alive():
+            return
+        _health_thread = threading.Thread(target=_health_loop, name="ollama-health", daemon=True)
+        _health_thread.start()
+
+
+def _record_ollama_timings(data: dict, wall_seconds: float, fields: dict) -> None:
+    # Ollama reports durations in nanoseconds; whatever is left of the wall time
+    # is queueing (OLLAMA_NUM_PARALLEL) plus HTTP/JSON overhead.
+    phases = {
+        "load": data.get("load_duration", 0) / 1e9,
+        "prompt_eval": data.get("prompt_eval_duration", 0) / 1e9,
+        "eval": data.get("eval_duration", 0) / 1e9,
+    }
+    phases["queue_other"] = max(0.0, wall_seconds - sum(phases.values()))
+    for phase, seconds in phases.items():
+        metrics.observe("ollama_phase_seconds", seconds, {"phase": phase})
+
+    metrics.inc("llm_tokens_total", {"kind": "prompt"}, data.get("prompt_eval_count", 0))
+    metrics.inc("llm_tokens_total", {"kind": "output"}, data.get("eval_count", 0))
+    fields.update(
+        prompt_tokens=data.get("prompt_eval_count"),
+        output_tokens=data.get("eval_count"),
+        **{f"{k}_ms": round(v * 1000, 1) for k, v in phases.items()},
+    )
+
+
+def _post_chat(payload: dict, prefer: str | None = None) -> dict:
+    """
+    Sends one /api/chat request to the least loaded healthy backend (or `prefer`),
+    failing over to the next backend when a connection is refused.
+    The host that answered is added to the response as "backend".
+    """
+    _ensure_health_checks()
+    model = payload["model"]
+    tried: set[str] = set()
+    last_error: Exception | None = None
+
+    while True:
+        backend = _acquire_backend(model, tried, prefer)
+        if backend is None:
+            metrics.inc("llm_requests_total", {"status": "unreachable"})
+            hosts = ", ".join(OLLAMA_HOSTS)
+            raise RuntimeError(
+                f"Cannot reach Ollama at {hosts}. "
+                f"Check podman network + ollama container name. Original: {last_error}"
+            )
+        tried.add(backend.host)
+
+        started = time.perf_counter()
+        try:
+            with metrics.span("llm_call", model=model, backend=backend.host,
+                              num_predict=payload["options"]["num_predict"]) as fields:
+                resp = requests.post(f"{backend.host}/api/chat", json=payload, timeout=(10, 1200))  # 20 min read timeout
+                resp.raise_for_status()
+                data = resp.json()
+                _record_ollama_timings(data, time.perf_counter() - started, fields)
+        except requests.exceptions.ConnectionError as e:
+            _release_backend(backend, model, failed=True)
+            metrics.inc("llm_backend_requests_total", {"backend": backend.host, "status": "unreachable"})
+            last_error = e
+            continue
+        except Exception as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            _release_backend(backend, model, errored=True, model_missing=status == 404)
+            metrics.inc("llm_backend_requests_total", {"backend": backend.host, "status": "error"})
+            metrics.inc("llm_requests_total", {"status": "error"})
+            raise
+
+        latency = time.perf_counter() - started
+        _release_backend(backend, model, latency=latency)
+        metrics.inc("llm_backend_requests_total", {"backend": backend.host, "status": "ok"})
+        metrics.observe("llm_backend_seconds", latency, {"backend": backend.host})
+        metrics.inc("llm_requests_total", {"status": "ok"})
+        data["backend"] = backend.host
+        return data
+
+
+def chat(messages: list[dict], *, num_predict: int | None = None, backend: str | None = None) -> dict:
+    """
+    Returns the full Ollama response: message.content plus eval_count, done_reason
+    ("length" when num_predict cut the output off), the timing fields and "backend".
+    """
     options = dict(DEFAULT_OPTIONS)
     if num_predict is not None:
         options["num_predict"] = int(num_predict)
 
     payload = {
         "model": OLLAMA_MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
+        "messages": messages,
         "stream": False,
         "options": options,
     }
+    data = _post_chat(payload, prefer=backend)
+    _local.calls = calls_on_thread() + 1
+    return data
 
-    try:
-        resp = requests.post(url, json=payload, timeout=(10, 1200))  # 20 min read timeout
-        resp.raise_for_status()
-        return resp.json().get("message", {}).get("content", "") or ""
-    except requests.exceptions.ConnectionError as e:
-        raise RuntimeError(
-            f"Cannot reach Ollama at {OLLAMA_HOST}. "
-            f"Check podman network + ollama container name. Original: {e}"
-        )
+
+class ChatSession:
+    """
+    A chat whose system + first user message stay byte-identical across calls, so
+    Ollama only evaluates what follows the part it already holds in its KV cache.
+    ask() samples a fresh answer to that prefix; correct() continues the chat with a
+    short instruction after the latest answer. Calls stay on the same backend.
+    """
+
+    def __init__(self, system_prompt: str, user_prompt: str):
+        self.prefix = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        self.turns: list[dict] = []  # assistant/user messages after the prefix
+        self.sticky = getattr(_local, "sticky", None)
+        self.backend: str | None = self.sticky["host"] if self.sticky else None
+
+    def ask(self, *, num_predict: int | None = None) -> dict:
+        self.turns = []
+        return self._send("ask", num_predict)
+
+    def correct(self, instruction: str, *, num_predict: int | None = None) -> dict:
+        self.turns.append({"role": "user", "content": instruction})
+        num_ctx = DEFAULT_OPTIONS["num_ctx"]
+        num_predict = num_predict or DEFAULT_OPTIONS["num_predict"]
+        # Older exchanges go first when the chat would no longer fit the context window
+        while len(self.turns) > 2 and estimate_tokens(self.prefix + self.turns) + num_predict > num_ctx:
+            self.turns = self.turns[2:]
+        room = num_ctx - estimate_tokens(self.prefix + self.turns)
+        if room < num_predict:
+            # A corrected answer is about as long as the one it corrects; if even that no longer
+            # fits, Ollama would cut the prompt's start, so sample a fresh answer instead
+            previous = estimate_tokens(self.turns[-2:-1])
+            if room < previous:
+                metrics.inc("llm_session_fallbacks_total")
+                return self.ask(num_predict=min(num_predict, num_ctx - estimate_tokens(self.prefix)))
+            num_predict = room
+        return self._send("correct", num_predict)
+
+    def _send(self, turn: str, num_predict: int | None) -> dict:
+        with metrics.span("llm_session_turn", turn=turn, history=len(self.turns)) as fields:
+            data = chat(self.prefix + self.turns, num_predict=num_predict, backend=self.backend)
+            fields.update(prompt_eval_tokens=data.get("prompt_eval_count", 0),
+                          prompt_eval_ms=round(data.get("prompt_eval_duration", 0) / 1e6))
+        self.backend = data.get("backend")
+        if self.sticky is not None:
+            self.sticky["host"] = self.backend
+        self.turns.append({"role": "assistant", "content": data.get("message", {}).get("content", "") or ""})
+
+        metrics.observe("llm_session_prompt_eval_seconds", data.get("prompt_eval_duration", 0) / 1e9, {"turn": turn})
+        metrics.inc("llm_session_prompt_tokens_total", {"turn": turn}, data.get("prompt_eval_count", 0))
+        return data
+
+
+def estimate_tokens(messages: list[dict]) -> int:
+    return sum(len(m.get("content", "")) for m in messages) // 4
+
+
+def call_llm(system_prompt: str, user_prompt: str, *, num_predict: int | None = None) -> str:
+    data = chat(
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        num_predict=num_predict,
+    )
+    return data.get("message", {}).get("content", "") or ""
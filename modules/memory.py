@@ -1,5 +1,6 @@
 import os
 import json
+import threading
 from datetime import datetime
 
 HISTORY_PATH = os.path.join(
@@ -8,21 +9,45 @@ HISTORY_PATH = os.path.join(
     "history_trip.json",  # <-- matches what you expect
 )
 
+# (stamp, parsed history file), replaced on every append and re-read only if another process
+# changed the file; always swapped in with one assignment so a stamp is never paired with other data
+_memo: tuple = (None, {})
+_write_lock = threading.Lock()
+
+
+def _stamp():
+    try:
+        st = os.stat(HISTORY_PATH)
+    except OSError:
+        return None
+    return HISTORY_PATH, st.st_mtime_ns, st.st_size
+
 
 def _load_history_file() -> dict:
-    if not os.path.exists(HISTORY_PATH):
+    global _memo
+    stamp = _stamp()
+    if stamp is None:
         return {}
+    memo_stamp, memo_data = _memo
+    if stamp == memo_stamp:
+        return memo_data
     try:
         with open(HISTORY_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+            data = json.load(f)
     except Exception:
         return {}
+    _memo = (stamp, data)
+    return data
 
 
 def _save_history_file(data: dict) -> None:
+    global _memo
     os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
-    with open(HISTORY_PATH, "w", encoding="utf-8") as f:
+    tmp_path = f"{HISTORY_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, HISTORY_PATH)
+    _memo = (_stamp(), data)
 
 
 def _normalize_user_key(user_name: str) -> str:
@@ -39,23 +64,25 @@ def load_trip_history(user_name: str):
 
 
 def append_trip_history(user_name: str, city: str, start_date: str, days: int, short_notes: str):
-    data = _load_history_file()
-    key = _normalize_user_key(user_name)
-    history = data.get(key, [])
-
-    history.append(
-        {
-            "user_name": (user_name or "").strip() or "Anonymous",
-            "city": city,
-            "start_date": start_date,
-            "days": days,
-            "created_at": datetime.utcnow().isoformat() + "Z",
-            "short_notes": (short_notes or "")[:200],
-        }
-    )
-
-    if len(history) > 20:
-        history = history[-20:]
-
-    data[key] = history
-    _save_history_file(data)
+    with _write_lock:
+        # Copy before modifying: readers may still hold the memoized dict and lists
+        data = dict(_load_history_file())
+        key = _normalize_user_key(user_name)
+        history = list(data.get(key, []))
+
+        history.append(
+            {
+                "user_name": (user_name or "").strip() or "Anonymous",
+                "city": city,
+                "start_date": start_date,
+                "days": days,
+                "created_at": datetime.utcnow().isoformat() + "Z",
+                "short_notes": (short_notes or "")[:200],
+            }
+        )
+
+        if len(history) > 20:
+            history = history[-20:]
+
+        data[key] = history
+        _save_history_file(data)
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import uuid
+import threading
+import functools
+from contextlib import contextmanager
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # /app
+TRACE_PATH = os.path.join(BASE_DIR, "logs", "trace.jsonl")
+
+PREFIX = "travel_agent_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+_lock = threading.Lock()
+_trace_lock = threading.Lock()
+_counters: dict[tuple, float] = {}
+_histograms: dict[tuple, dict] = {}
+_gauges: dict[tuple, float] = {}
+_help: dict[str, str] = {}
+_local = threading.local()
+
+
+def _key(name: str, labels: dict | None) -> tuple:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def describe(name: str, text: str) -> None:
+    _help[name] = text
+
+
+def inc(name: str, labels: dict | None = None, value: float = 1.0) -> None:
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0.0) + value
+
+
+def set_gauge(name: str, value: float, labels: dict | None = None) -> None:
+    with _lock:
+        _gauges[_key(name, labels)] = float(value)
+
+
+def observe(name: str, value: float, labels: dict | None = None) -> None:
+    k = _key(name, labels)
+    with _lock:
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                h["buckets"][i] += 1
+        h["sum"] += value
+        h["count"] += 1
+
+
+def _trace_enabled() -> bool:
+    return os.getenv("TRACE_LOG", "0").strip().lower() in ("1", "true", "yes")
+
+
+def _write_trace(record: dict) -> None:
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _trace_lock:
+        os.makedirs(os.path.dirname(TRACE_PATH), exist_ok=True)
+        with open(TRACE_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def current_trace_id() -> str | None:
+    return getattr(_local, "trace_id", None)
+
+
+@contextmanager
+def trace(name: str):
+    """
+    Groups the spans of one run (a plan, an export, a summary) under a trace id.
+    Nested calls reuse the outer trace.
+    """
+    if current_trace_id() is not None:
+        with span(name):
+            yield
+        return
+
+    _local.trace_id = uuid.uuid4().hex[:16]
+    try:
+        with span(name):
+            yield
+    finally:
+        _local.trace_id = None
+
+
+def traced(name: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with trace(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def span(stage: str, **fields):
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("stage_duration_seconds", elapsed, {"stage": stage})
+        if _trace_enabled():
+            _write_trace({
+                "ts": time.time(),
+                "trace_id": current_trace_id(),
+                "stage": stage,
+                "duration_ms": round(elapsed * 1000, 3),
+                "status": status,
+                **fields,
+            })
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    parts = []
+    for k, v in items:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def render_prometheus() -> str:
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"]}
+                      for k, v in _histograms.items()}
+
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        full = PREFIX + name
+        if full not in seen:
+            seen.add(full)
+            if name in _help:
+                lines.append(f"# HELP {full} {_help[name]}")
+            lines.append(f"# TYPE {full} counter")
+        lines.append(f"{full}{_format_labels(labels)} {value:g}")
+
+    for (name, labels), value in sorted(gauges.items()):
+        full = PREFIX + name
+        if full not in seen:
+            seen.add(full)
+            if name in _help:
+                lines.append(f"# HELP {full} {_help[name]}")
+            lines.append(f"# TYPE {full} gauge")
+        lines.append(f"{full}{_format_labels(labels)} {value:g}")
+
+    for (name, labels), h in sorted(histograms.items()):
+        full = PREFIX + name
+        if full not in seen:
+            seen.add(full)
+            if name in _help:
+                lines.append(f"# HELP {full} {_help[name]}")
+            lines.append(f"# TYPE {full} histogram")
+        for bound, count in zip(BUCKETS, h["buckets"]):
+            lines.append(f"{full}_bucket{_format_labels(labels, (('le', f'{bound:g}'),))} {count}")
+        lines.append(f"{full}_bucket{_format_labels(labels, (('le', '+Inf'),))} {h['count']}")
+        lines.append(f"{full}_sum{_format_labels(labels)} {h['sum']:.6f}")
+        lines.append(f"{full}_count{_format_labels(labels)} {h['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+describe("stage_duration_seconds", "Wall time spent in each pipeline stage.")
+describe("cache_requests_total", "Disk cache lookups by key namespace and result.")
+describe("llm_requests_total", "Ollama chat calls by outcome.")
+describe("llm_tokens_total", "Prompt and output tokens reported by Ollama.")
+describe("ollama_phase_seconds", "Ollama-reported load/prompt_eval/eval time and the remaining queue/overhead.")
+describe("plan_attempts_total", "LLM generation attempts made by the planner.")
+describe("plan_autofix_total", "Auto-fix outcomes after a failed validation.")
+describe("plan_reuse_total", "Stored itinerary lookups by result.")
+describe("llm_backend_requests_total", "Ollama chat calls per backend and outcome.")
+describe("llm_backend_seconds", "Ollama chat wall time per backend.")
+describe("llm_backend_outstanding", "In-flight Ollama requests per backend.")
+describe("llm_backend_healthy", "1 if the backend passed its last health check.")
+describe("plan_day_walk_km", "Estimated walking distance per planned day (km, straight-line route).")
+describe("pdf_render_seconds_per_page", "ReportLab render time divided by the page count.")
+describe("batch_rows_total", "Batch PDF export manifest rows by final status.")
+describe("admission_rejected_total", "Requests turned away with 429 by reason (user_quota, saturated, timeout).")
+describe("admission_queue_depth", "Requests waiting in the fair queue for an LLM slot.")
+describe("admission_running", "Requests currently holding an LLM slot.")
+describe("admission_wait_seconds", "Time spent in the fair queue before getting an LLM slot.")
+describe("llm_truncated_total", "LLM outputs cut off by num_predict (done_reason=length), by mode.")
+describe("llm_session_prompt_eval_seconds", "Ollama prompt evaluation time per chat session turn (ask = fresh answer, correct = follow-up).")
+describe("llm_session_prompt_tokens_total", "Prompt tokens Ollama had to evaluate per chat session turn kind.")
+describe("llm_session_fallbacks_total", "Follow-ups that no longer fit num_ctx and were replaced by a fresh answer.")
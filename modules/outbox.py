@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import uuid
+import smtplib
+import threading
+from datetime import datetime
+
+from modules import emailer
+
+OUTBOX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "outbox")
+FAILED_DIR = os.path.join(OUTBOX_DIR, "failed")
+
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 6
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+IDLE_CLOSE_SECONDS = 60
+POLL_SECONDS = 30
+# A claimed (*.sending) record untouched for this long belongs to a process that died mid-send
+CLAIM_STALE_SECONDS = 30 * 60
+
+_send_lock = threading.Lock()
+_wake = threading.Event()
+_worker: threading.Thread | None = None
+_worker_lock = threading.Lock()
+
+# Pooled SMTP connection, only touched while holding _send_lock
+_conn: smtplib.SMTP | None = None
+_conn_last_used = 0.0
+
+
+def _write_record(path: str, record: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_record(path: str) -> dict | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def enqueue(to_email: str, subject: str, body: str, attachments: list | None = None) -> str | None:
+    settings = emailer.smtp_settings()
+    if settings is None:
+        print("[email] SMTP not configured. Skipping email send.")
+        return None
+
+    # Serialize the full MIME message now so attachments are snapshotted at enqueue time
+    msg = emailer.build_message(settings["from_email"], to_email, subject, body, attachments)
+    msg_id = f"{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+    record = {
+        "id": msg_id,
+        "to": to_email,
+        "subject": subject,
+        "attempts": 0,
+        "next_attempt": 0,
+        "last_error": "",
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "message": msg.as_string(),
+    }
+
+    os.makedirs(OUTBOX_DIR, exist_ok=True)
+    _write_record(os.path.join(OUTBOX_DIR, f"{msg_id}.json"), record)
+    print(f"[email] Queued email to {to_email}")
+
+    start_worker()
+    _wake.set()
+    return msg_id
+
+
+def pending() -> list[str]:
+    if not os.path.isdir(OUTBOX_DIR):
+        return []
+    return sorted(
+        os.path.join(OUTBOX_DIR, name) for name in os.listdir(OUTBOX_DIR) if name.endswith(".json")
+    )
+
+
+def _claimed() -> list[str]:
+    if not os.path.isdir(OUTBOX_DIR):
+        return []
+    return sorted(
+        os.path.join(OUTBOX_DIR, name) for name in os.listdir(OUTBOX_DIR) if name.endswith(".sending")
+    )
+
+
+def _claim(path: str) -> str | None:
+    # The web worker and CLI runs share data/outbox: rename is atomic, so exactly one process
+    # owns a record while it is being sent
+    claim = path[: -len(".json")] + ".sending"
+    try:
+        os.rename(path, claim)
+    except OSError:
+        return None
+    os.utime(claim)
+    return claim
+
+
+def _release(claim: str, path: str, record: dict) -> None:
+    _write_record(claim, record)
+    os.replace(claim, path)
+
+
+def _recover_stale_claims() -> None:
+    now = time.time()
+    for claim in _claimed():
+        try:
+            if now - os.path.getmtime(claim) > CLAIM_STALE_SECONDS:
+                os.rename(claim, claim[: -len(".sending")] + ".json")
+        except OSError:
+            pass
+
+
+def _due(limit: int) -> tuple[list[tuple[str, dict]], float | None]:
+    _recover_stale_claims()
+    now = time.time()
+    due = []
+    next_due = None
+    for path in pending():
+        record = _read_record(path)
+        if record is None:
+            continue
+        at = record.get("next_attempt", 0)
+        if at <= now:
+            if len(due) < limit:
+                due.append((path, record))
+        elif next_due is None or at < next_due:
+            next_due = at
+    return due, next_due
+
+
+def _close_connection() -> None:
+    global _conn
+    if _conn is not None:
+        try:
+            _conn.quit()
+        except Exception:
+            try:
+                _conn.close()
+            except Exception:
+                pass
+    _conn = None
+
+
+def _get_connection(settings: dict) -> smtplib.SMTP:
+    global _conn, _conn_last_used
+    if _conn is not None:
+        try:
+            if _conn.noop()[0] == 250:
+                return _conn
+        except Exception:
+            pass
+        _close_connection()
+    _conn = emailer.open_smtp_connection(settings)
+    _conn_last_used = time.time()
+    return _conn
+
+
+def _mark_failed(path: str, claim: str, record: dict, error: Exception, permanent: bool = False) -> None:
+    record["attempts"] = record.get("attempts", 0) + 1
+    record["last_error"] = str(error)[:300]
+
+    if permanent or record["attempts"] >= MAX_ATTEMPTS:
+        os.makedirs(FAILED_DIR, exist_ok=True)
+        _write_record(os.path.join(FAILED_DIR, os.path.basename(path)), record)
+        os.remove(claim)
+        reason = "rejected by the server" if permanent else f"after {record['attempts']} attempts"
+        print(f"[email] Giving up on email to {record.get('to')} ({reason}): {error}")
+        return
+
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (record["attempts"] - 1))
+    record["next_attempt"] = time.time() + delay
+    _release(claim, path, record)
+    print(f"[email] Failed to send email to {record.get('to')} (retry in {delay}s): {error}")
+
+
+def _is_permanent(error: smtplib.SMTPException) -> bool:
+    # 5xx replies (unknown mailbox, message rejected) will not succeed on retry
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _send_batch(settings: dict, batch: list[tuple[str, dict]]) -> None:
+    global _conn_last_used
+    claimed = []
+    for path, _ in batch:
+        claim = _claim(path)
+        if claim is None:
+            continue  # another process took it
+        record = _read_record(claim)
+        if record is None or record.get("next_attempt", 0) > time.time():
+            # Rescheduled by another process since _due() read it
+            os.replace(claim, path)
+            continue
+        claimed.append((path, claim, record))
+    if not claimed:
+        return
+
+    try:
+        conn = _get_connection(settings)
+    except Exception as e:
+        for path, claim, record in claimed:
+            _mark_failed(path, claim, record, e)
+        return
+
+    for i, (path, claim, record) in enumerate(claimed):
+        try:
+            conn.sendmail(settings["from_email"], [record["to"]], record["message"].encode("utf-8"))
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+            # The server answered for this message only; the connection is still usable
+            _mark_failed(path, claim, record, e, permanent=_is_permanent(e))
+            continue
+        except (smtplib.SMTPServerDisconnected, OSError) as e:
+            # Connection is gone (SMTPException subclasses OSError, so this comes after the
+            # per-message replies): reschedule the rest of the batch and reconnect next round
+            _close_connection()
+            for p, c, r in claimed[i:]:
+                _mark_failed(p, c, r, e)
+            return
+
+        _conn_last_used = time.time()
+        os.remove(claim)
+        print(f"[email] Email sent to {record['to']}")
+
+
+def process_due(limit: int = BATCH_SIZE) -> float | None:
+    """
+    Sends due messages in batches over the pooled connection.
+    Returns the timestamp of the next scheduled retry, or None if nothing is waiting.
+    """
+    settings = emailer.smtp_settings()
+    if settings is None:
+        return None
+
+    with _send_lock:
+        while True:
+            batch, next_due = _due(limit)
+            if not batch:
+                if _conn is not None and time.time() - _conn_last_used > IDLE_CLOSE_SECONDS:
+                    _close_connection()
+                return next_due
+            _send_batch(settings, batch)
+
+
+def flush() -> int:
+    """
+    Sends everything that is currently due, closes the pooled connection and
+    returns how many messages remain queued (e.g. waiting for a retry).
+    """
+    process_due()
+    with _send_lock:
+        _close_connection()
+    return len(pending()) + len(_claimed())
+
+
+def _worker_loop() -> None:
+    while True:
+        try:
+            next_due = process_due()
+        except Exception as e:
+            print(f"[email] Outbox worker error: {e}")
+            next_due = None
+
+        wait = POLL_SECONDS if next_due is None else max(0.0, min(POLL_SECONDS, next_due - time.time()))
+        if _conn is not None:
+            wait = min(wait, IDLE_CLOSE_SECONDS)
+        _wake.wait(wait)
+        _wake.clear()
+
+
+def start_worker() -> None:
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=_worker_loop, name="email-outbox", daemon=True)
+        _worker.start()
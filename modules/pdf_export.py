@@ -1,5 +1,11 @@
+import io
 import os
 import re
+import hashlib
+import time
+import threading
+import functools
+from collections import OrderedDict
 from typing import List, Tuple
 
 from reportlab.lib.pagesizes import A4
@@ -16,11 +22,17 @@ from reportlab.platypus import (
 )
 from reportlab.lib.utils import ImageReader
 
+from modules import metrics
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # /app
 EXPORTS_DIR = os.path.join(BASE_DIR, "exports")
 PDF_DIR = os.path.join(EXPORTS_DIR, "itineraries")
 
+# In-memory exports (PDF_EXPORT_MODE=memory), served by /download and attached to emails
+MEMORY_MAX_PDFS = 32
+_memory_pdfs: "OrderedDict[str, tuple[bytes, str]]" = OrderedDict()  # filename -> (data, etag)
+_memory_lock = threading.Lock()
+
 
 def _strip_html(s: str) -> str:
     s = re.sub(r"<[^>]+>", "", s)
@@ -44,32 +56,14 @@ def _draw_page_number(canvas, doc):
     canvas.restoreState()
 
 
-def export_itinerary_pdf(
-    filename: str,
-    title: str,
-    itinerary_text: str,
-    images: List[Tuple[str, str]],  # (place_name, image_path)
-    attributions: List[str],
-) -> str:
-    os.makedirs(PDF_DIR, exist_ok=True)
-    out_path = os.path.join(PDF_DIR, filename)
-
-    doc = SimpleDocTemplate(
-        out_path,
-        pagesize=A4,
-        leftMargin=18 * mm,
-        rightMargin=18 * mm,
-        topMargin=18 * mm,
-        bottomMargin=18 * mm,
-        title=title,
-        author="AI Travel Operations Agent",
-    )
-
-    styles = getSampleStyleSheet()
+@functools.lru_cache(maxsize=1)
+def _styles() -> dict:
+    # Built once per process: getSampleStyleSheet() and the ParagraphStyles never change
+    base = getSampleStyleSheet()
 
     title_style = ParagraphStyle(
         "TitleStyle",
-        parent=styles["Title"],
+        parent=base["Title"],
         fontName="Helvetica-Bold",
         fontSize=20,
         leading=24,
@@ -79,7 +73,7 @@ def export_itinerary_pdf(
 
     h_style = ParagraphStyle(
         "Heading",
-        parent=styles["Heading2"],
+        parent=base["Heading2"],
         fontName="Helvetica-Bold",
         fontSize=13,
         leading=16,
@@ -89,7 +83,7 @@ def export_itinerary_pdf(
 
     body_style = ParagraphStyle(
         "Body",
-        parent=styles["BodyText"],
+        parent=base["BodyText"],
         fontName="Helvetica",
         fontSize=10.5,
         leading=14,
@@ -98,7 +92,7 @@ def export_itinerary_pdf(
 
     mono_style = ParagraphStyle(
         "Mono",
-        parent=styles["BodyText"],
+        parent=base["BodyText"],
         fontName="Courier",
         fontSize=9.5,
         leading=12,
@@ -107,13 +101,49 @@ def export_itinerary_pdf(
 
     small_style = ParagraphStyle(
         "Small",
-        parent=styles["BodyText"],
+        parent=base["BodyText"],
         fontName="Helvetica",
         fontSize=9,
         leading=12,
         spaceAfter=3,
     )
 
+    return {
+        "title": title_style,
+        "heading": h_style,
+        "body": body_style,
+        "mono": mono_style,
+        "small": small_style,
+    }
+
+
+def render_itinerary_pdf(
+    title: str,
+    itinerary_text: str,
+    images: List[tuple],  # (place_name, image_path) or (place_name, image_path, (width, height))
+    attributions: List[str],
+) -> Tuple[bytes, int]:
+    """
+    Renders the itinerary PDF into memory and returns (pdf_bytes, page_count).
+    """
+    started = time.perf_counter()
+    buf = io.BytesIO()
+
+    doc = SimpleDocTemplate(
+        buf,
+        pagesize=A4,
+        leftMargin=18 * mm,
+        rightMargin=18 * mm,
+        topMargin=18 * mm,
+        bottomMargin=18 * mm,
+        title=title,
+        author="AI Travel Operations Agent",
+    )
+
+    styles = _styles()
+    title_style, h_style, body_style = styles["title"], styles["heading"], styles["body"]
+    mono_style, small_style = styles["mono"], styles["small"]
+
     story = []
 
     # --- Title ---
@@ -156,13 +186,15 @@ def export_itinerary_pdf(
         max_img_w = A4[0] - doc.leftMargin - doc.rightMargin
         max_img_h = 85 * mm
 
-        for place_name, img_path in images:
+        for image in images:
+            place_name, img_path = image[0], image[1]
+            size = image[2] if len(image) > 2 else None
             if not img_path or not os.path.exists(img_path):
                 continue
 
             try:
-                ir = ImageReader(img_path)
-                iw, ih = ir.getSize()
+                # Dimensions normally come from the download step; ImageReader is the fallback
+                iw, ih = size if size else ImageReader(img_path).getSize()
                 scale = min(max_img_w / iw, max_img_h / ih)
                 w = iw * scale
                 h = ih * scale
@@ -194,4 +226,56 @@ def export_itinerary_pdf(
                 story.append(Paragraph(cleaned, mono_style))
 
     doc.build(story, onFirstPage=_draw_page_number, onLaterPages=_draw_page_number)
+
+    pages = doc.page
+    metrics.observe("pdf_render_seconds_per_page", (time.perf_counter() - started) / max(1, pages))
+    return buf.getvalue(), pages
+
+
+def content_etag(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def remember_pdf(filename: str, data: bytes) -> None:
+    etag = content_etag(data)
+    with _memory_lock:
+        _memory_pdfs[filename] = (data, etag)
+        _memory_pdfs.move_to_end(filename)
+        while len(_memory_pdfs) > MEMORY_MAX_PDFS:
+            _memory_pdfs.popitem(last=False)
+
+
+def get_memory_pdf(filename: str) -> bytes | None:
+    entry = get_memory_pdf_entry(filename)
+    return entry[0] if entry else None
+
+
+def get_memory_pdf_entry(filename: str) -> tuple[bytes, str] | None:
+    """Returns (data, etag) for an in-memory export."""
+    with _memory_lock:
+        return _memory_pdfs.get(filename)
+
+
+def export_itinerary_pdf(
+    filename: str,
+    title: str,
+    itinerary_text: str,
+    images: List[tuple],  # (place_name, image_path) or (place_name, image_path, (width, height))
+    attributions: List[str],
+    in_memory: bool = False,
+) -> str:
+    """
+    Returns the path of the written PDF, or just the filename when in_memory=True
+    (the bytes are then available through get_memory_pdf).
+    """
+    data, _pages = render_itinerary_pdf(title, itinerary_text, images, attributions)
+
+    if in_memory:
+        remember_pdf(filename, data)
+        return filename
+
+    os.makedirs(PDF_DIR, exist_ok=True)
+    out_path = os.path.join(PDF_DIR, filename)
+    with open(out_path, "wb") as f:
+        f.write(data)
     return out_path
@@ -1,23 +1,61 @@
+import io
 import os
 import re
+import threading
 import requests
-from dotenv import load_dotenv
+from modules import config
 from modules.cache import cache_get, cache_set
 
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # /app
-load_dotenv(os.path.join(BASE_DIR, "config", ".env"))
+BASE_DIR = config.BASE_DIR
 
 PLACES_KEY = os.getenv("PLACES_API_KEY")
-PHOTO_URL = "https://maps.googleapis.com/maps/api/place/photo"
+PHOTO_URL = os.getenv("PLACES_PHOTO_URL", "https://maps.googleapis.com/maps/api/place/photo")
 
 EXPORTS_DIR = os.path.join(BASE_DIR, "exports")
 IMG_DIR = os.path.join(EXPORTS_DIR, "images")
 
+PHOTO_CACHE_MAX_AGE = 7 * 24 * 3600
+
+# (width, height) per downloaded file name, so the PDF export never reopens images for their size
+_sizes: dict[str, tuple[int, int]] = {}
+
+# One lock per photo, so concurrent plans (batch export) using the same place download it once
+_download_locks: dict[str, threading.Lock] = {}
+_download_locks_guard = threading.Lock()
+
 def _safe_name(s: str) -> str:
     s = s.strip()
     s = re.sub(r"[^a-zA-Z0-9_\-]+", "_", s)
     return s[:80] if s else "place"
 
+def _read_size(data_or_path) -> tuple[int, int] | None:
+    from PIL import Image
+
+    try:
+        src = io.BytesIO(data_or_path) if isinstance(data_or_path, bytes) else data_or_path
+        with Image.open(src) as img:  # only parses the header
+            return img.size
+    except Exception:
+        return None
+
+def _remember_size(fpath: str, size: tuple[int, int] | None) -> None:
+    if size:
+        _sizes[os.path.basename(fpath)] = size
+        cache_set(f"photo_size:{os.path.basename(fpath)}", list(size))
+
+def photo_size(fpath: str) -> tuple[int, int] | None:
+    name = os.path.basename(fpath)
+    if name in _sizes:
+        return _sizes[name]
+    cached = cache_get(f"photo_size:{name}", max_age_seconds=PHOTO_CACHE_MAX_AGE)
+    if cached:
+        _sizes[name] = tuple(cached)
+        return _sizes[name]
+    # Photos downloaded before sizes were recorded
+    size = _read_size(fpath)
+    _remember_size(fpath, size)
+    return size
+
 def download_photo(photo_reference: str, place_name: str, max_width: int = 900) -> str | None:
     if not PLACES_KEY or not photo_reference:
         return None
@@ -30,7 +68,15 @@ def download_photo(photo_reference: str, place_name: str, max_width: int = 900)
         return fpath
 
     cache_key = f"photo:{photo_reference}:{max_width}"
-    cached_path = cache_get(cache_key, max_age_seconds=7 * 24 * 3600)
+    with _download_locks_guard:
+        lock = _download_locks.setdefault(cache_key, threading.Lock())
+    with lock:
+        return _download(photo_reference, max_width, fpath, cache_key)
+
+def _download(photo_reference: str, max_width: int, fpath: str, cache_key: str) -> str | None:
+    if os.path.exists(fpath):
+        return fpath
+    cached_path = cache_get(cache_key, max_age_seconds=PHOTO_CACHE_MAX_AGE)
     if cached_path and os.path.exists(cached_path):
         return cached_path
 
@@ -43,4 +89,5 @@ def download_photo(photo_reference: str, place_name: str, max_width: int = 900)
         f.write(r.content)
 
     cache_set(cache_key, fpath)
+    _remember_size(fpath, _read_size(r.content))
     return fpath
@@ -1,41 +1,188 @@
 import os
+import time
+import threading
 import requests
 from typing import Optional
-from dotenv import load_dotenv
-from modules.cache import cache_get, cache_set
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # /app
-load_dotenv(os.path.join(BASE_DIR, "config", ".env"))
+from modules import config  # noqa: F401 - loads config/.env
+from modules.cache import cache_get, cache_get_entry, cache_set, cache_migrate
 
 PLACES_KEY = os.getenv("PLACES_API_KEY")
-TEXTSEARCH_URL = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+TEXTSEARCH_URL = os.getenv("PLACES_TEXTSEARCH_URL", "https://maps.googleapis.com/maps/api/place/textsearch/json")
 
-def search_attractions(city: str, limit: int = 8, query: Optional[str] = None):
-    if not PLACES_KEY:
-        raise RuntimeError("PLACES_API_KEY not set in config/.env")
+CACHE_MAX_AGE = 24 * 3600
+# Version of the compact place record stored in the cache (v1 kept the raw photos array)
+PLACE_RECORD_VERSION = 2
+MAX_VIBE_QUERIES = 3
+TEXTSEARCH_PREFIX = "places:textsearch:"
+
+# (keywords found in the vibe, extra Text Search query)
+VIBE_QUERIES = [
+    (("food", "eat", "restaurant", "street", "market", "cafe", "coffee", "dessert", "foodie"), "{city} best food markets and restaurants"),
+    (("museum", "museums", "history", "art", "gallery", "culture", "heritage"), "{city} museums and galleries"),
+    (("nightlife", "bar", "bars", "club", "night", "drinks"), "{city} nightlife"),
+    (("shopping", "shop", "mall", "fashion", "boutique"), "{city} shopping districts"),
+    (("nature", "park", "parks", "hike", "hiking", "garden", "outdoor", "beach"), "{city} parks and nature"),
+    (("temple", "temples", "shrine", "church", "religious", "spiritual"), "{city} temples and shrines"),
+    (("anime", "manga", "otaku", "games", "gaming"), "{city} anime and pop culture spots"),
+    (("kids", "family", "zoo", "aquarium", "theme"), "{city} family attractions"),
+]
+
+# One pooled session so concurrent sub-queries reuse TLS connections to the Places API
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=MAX_VIBE_QUERIES + 1))
+_session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=MAX_VIBE_QUERIES + 1))
+
+_migrate_lock = threading.Lock()
+_migrated = False
+
+
+def vibe_queries(city: str, vibe: str) -> list[str]:
+    words = set("".join(c if c.isalnum() else " " for c in (vibe or "").lower()).split())
+    queries = [f"{city} top attractions"]
+    for keywords, template in VIBE_QUERIES:
+        if len(queries) > MAX_VIBE_QUERIES:
+            break
+        if words.intersection(keywords):
+            queries.append(template.format(city=city))
+    return queries
+
+
+def _place_record(name, rating, address, place_id, location: dict | None, photos: list | None) -> dict:
+    location = location or {}
+    first = photos[0] if photos and isinstance(photos[0], dict) else {}
+    return {
+        "v": PLACE_RECORD_VERSION,
+        "name": name,
+        "rating": rating,
+        "address": address,
+        "place_id": place_id,
+        "lat": location.get("lat"),
+        "lng": location.get("lng"),
+        "photo_ref": first.get("photo_reference"),
+        "photo_attribution": " ".join(first.get("html_attributions") or [])[:300],
+    }
+
+
+def _slim_result(r: dict) -> dict:
+    return _place_record(
+        r.get("name"), r.get("rating"), r.get("formatted_address"), r.get("place_id"),
+        (r.get("geometry") or {}).get("location"), r.get("photos"),
+    )
+
+
+def _upgrade_record(item: dict) -> dict:
+    if item.get("v") == PLACE_RECORD_VERSION:
+        return item
+    # v1: {"name", "rating", "address", "place_id", "photos": [...full API photo objects...]}
+    return _place_record(
+        item.get("name"), item.get("rating"), item.get("address"), item.get("place_id"),
+        None, item.get("photos"),
+    )
+
+
+def _migrate_legacy_entries(data: dict) -> bool:
+    # Before v2, entries were keyed "places:textsearch:{query}:{limit}" and held the raw photos
+    # arrays. Fresh ones move to "places:textsearch:{query}" as v2 records; the rest are dropped.
+    changed = False
+    legacy: dict[str, dict] = {}
+    for key in [k for k in data if k.startswith(TEXTSEARCH_PREFIX)]:
+        item = data[key] or {}
+        value = item.get("value") if isinstance(item.get("value"), list) else []
+        query, _, limit = key[len(TEXTSEARCH_PREFIX):].rpartition(":")
+        if query and limit.isdigit():
+            del data[key]
+            changed = True
+            fresh = time.time() - item.get("ts", 0) <= CACHE_MAX_AGE
+            if fresh and value and len(value) > len((legacy.get(query) or {}).get("value", [])):
+                legacy[query] = {"ts": item.get("ts", 0), "value": value}
+        elif any(x.get("v") != PLACE_RECORD_VERSION for x in value):
+            data[key] = {"ts": item.get("ts", 0), "value": [_upgrade_record(x) for x in value]}
+            changed = True
+
+    for query, item in legacy.items():
+        if TEXTSEARCH_PREFIX + query not in data:
+            data[TEXTSEARCH_PREFIX + query] = {"ts": item["ts"], "value": [_upgrade_record(x) for x in item["value"]]}
+    return changed
 
-    if query is None:
-        query = f"{city} top attractions"
 
-    cache_key = f"places:textsearch:{query}:{limit}"
-    cached = cache_get(cache_key, max_age_seconds=24 * 3600)
+def _ensure_migrated() -> None:
+    global _migrated
+    if _migrated:
+        return
+    with _migrate_lock:
+        if not _migrated:
+            cache_migrate(_migrate_legacy_entries)
+            _migrated = True
+
+
+def _text_search(query: str) -> list[dict]:
+    _ensure_migrated()
+    cache_key = f"{TEXTSEARCH_PREFIX}{query}"
+    cached = cache_get(cache_key, max_age_seconds=CACHE_MAX_AGE)
     if cached:
-        return cached
+        if all(item.get("v") == PLACE_RECORD_VERSION for item in cached):
+            return cached
+        # Old-format entry: upgrade on read and rewrite it without refreshing its age
+        upgraded = [_upgrade_record(item) for item in cached]
+        entry = cache_get_entry(cache_key) or {}
+        cache_set(cache_key, upgraded, ts=entry.get("ts"))
+        return upgraded
 
-    resp = requests.get(TEXTSEARCH_URL, params={"query": query, "key": PLACES_KEY}, timeout=30)
+    resp = _session.get(TEXTSEARCH_URL, params={"query": query, "key": PLACES_KEY}, timeout=30)
     resp.raise_for_status()
     data = resp.json()
 
-    results = data.get("results", [])[:limit]
-    simplified = []
-    for r in results:
-        simplified.append({
-            "name": r.get("name"),
-            "rating": r.get("rating"),
-            "address": r.get("formatted_address"),
-            "place_id": r.get("place_id"),
-            "photos": r.get("photos", []),
-        })
+    simplified = [_slim_result(r) for r in data.get("results", [])]
 
     cache_set(cache_key, simplified)
     return simplified
+
+
+def _merge_ranked(result_lists: list[list[dict]], limit: int) -> list[dict]:
+    merged: dict[str, dict] = {}
+    scores: dict[str, float] = {}
+
+    for qi, results in enumerate(result_lists):
+        n = max(1, len(results))
+        for rank, r in enumerate(results):
+            key = r.get("place_id") or (r.get("name") or "").lower()
+            if not key:
+                continue
+            # Relevance: position within the sub-query, boosted for vibe queries and
+            # for places that several queries agree on
+            relevance = 1.0 - rank / n + (0.5 if qi > 0 else 0.0)
+            if key in merged:
+                scores[key] += 0.6 + relevance / 2
+                continue
+            merged[key] = r
+            scores[key] = float(r.get("rating") or 3.5) + relevance
+
+    ranked = sorted(merged, key=lambda k: scores[k], reverse=True)
+    return [merged[k] for k in ranked[:limit]]
+
+
+def search_attractions(city: str, limit: int = 8, query: Optional[str] = None, vibe: str = ""):
+    if not PLACES_KEY:
+        raise RuntimeError("PLACES_API_KEY not set in config/.env")
+
+    if query is not None:
+        return _text_search(query)[:limit]
+
+    queries = vibe_queries(city, vibe)
+    if len(queries) == 1:
+        return _text_search(queries[0])[:limit]
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        futures = [pool.submit(_text_search, q) for q in queries]
+
+    result_lists = [futures[0].result()]  # the base query must succeed
+    for q, fut in zip(queries[1:], futures[1:]):
+        try:
+            result_lists.append(fut.result())
+        except Exception as e:
+            print(f"[places] Vibe query failed ({q}): {e}")
+
+    return _merge_ranked(result_lists, limit)
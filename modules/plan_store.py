@@ -0,0 +1,161 @@
+import os
+import re
+import json
+import uuid
+import threading
+from datetime import datetime, timedelta
+
+from modules import config  # noqa: F401 - loads config/.env
+
+STORE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)),
+    "data",
+    "plan_store.json",
+)
+
+MAX_PLANS = 500
+MIN_VIBE_SIMILARITY = 0.5
+# Stored plans older than this are not reused, so retries eventually get a fresh plan
+MAX_PLAN_AGE = timedelta(days=int(os.getenv("PLAN_STORE_MAX_AGE_DAYS", "7")))
+
+_write_lock = threading.Lock()
+
+_STOPWORDS = {
+    "a", "an", "and", "the", "of", "to", "in", "on", "for", "with", "at", "by",
+    "or", "some", "lots", "lot", "very", "more", "less", "pace", "trip", "style",
+}
+
+_DAY_HEADER_RE = re.compile(r"^(\s*Day\s+(\d+)\s*[–-]\s*)\d{4}-\d{2}-\d{2}(\s*)$", re.MULTILINE)
+
+
+def _load_store() -> dict:
+    if not os.path.exists(STORE_PATH):
+        return {"plans": {}, "index": {}}
+    try:
+        with open(STORE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return {"plans": {}, "index": {}}
+    data.setdefault("plans", {})
+    data.setdefault("index", {})
+    return data
+
+
+def _save_store(data: dict) -> None:
+    os.makedirs(os.path.dirname(STORE_PATH), exist_ok=True)
+    tmp_path = f"{STORE_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, STORE_PATH)
+
+
+def _normalize_city(city: str) -> str:
+    return " ".join((city or "").lower().split())
+
+
+def vibe_keywords(vibe: str) -> list[str]:
+    words = re.findall(r"[a-z0-9]+", (vibe or "").lower())
+    return sorted({w for w in words if len(w) > 2 and w not in _STOPWORDS})
+
+
+def _index_terms(city: str, days: int, season_label: str, owner: str, keywords: list[str]) -> list[str]:
+    # The planner prompt carries the user's name and trip history, so a plan is only
+    # reused for the user it was generated for
+    terms = [f"city:{_normalize_city(city)}", f"days:{int(days)}", f"season:{(season_label or '').lower()}",
+             f"user:{owner}"]
+    terms += [f"vibe:{k}" for k in keywords]
+    return terms
+
+
+def _jaccard(a: list[str], b: list[str]) -> float:
+    sa, sb = set(a), set(b)
+    if not sa and not sb:
+        return 1.0
+    return len(sa & sb) / len(sa | sb)
+
+
+def _unindex(data: dict, plan_id: str) -> None:
+    plan = data["plans"].pop(plan_id, None)
+    if not plan:
+        return
+    for term in plan.get("terms", []):
+        ids = data["index"].get(term)
+        if not ids:
+            continue
+        if plan_id in ids:
+            ids.remove(plan_id)
+        if not ids:
+            data["index"].pop(term, None)
+
+
+def _find_candidates(data: dict, city: str, days: int, season_label: str, owner: str) -> list[str]:
+    required = _index_terms(city, days, season_label, owner, [])
+    postings = [set(data["index"].get(term, [])) for term in required]
+    return sorted(set.intersection(*postings))
+
+
+def save_plan(city: str, start_date: str, days: int, season_label: str, vibe: str, itinerary: str,
+              owner: str) -> str:
+    keywords = vibe_keywords(vibe)
+    terms = _index_terms(city, days, season_label, owner, keywords)
+
+    with _write_lock:
+        data = _load_store()
+
+        # One stored plan per exact key: replace older duplicates instead of piling them up
+        for plan_id in _find_candidates(data, city, days, season_label, owner):
+            if data["plans"][plan_id].get("vibe_keywords") == keywords:
+                _unindex(data, plan_id)
+
+        plan_id = uuid.uuid4().hex[:12]
+        data["plans"][plan_id] = {
+            "city": city,
+            "start_date": start_date,
+            "days": int(days),
+            "season": season_label,
+            "vibe_keywords": keywords,
+            "owner": owner,
+            "itinerary": itinerary,
+            "terms": terms,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+        }
+        for term in terms:
+            data["index"].setdefault(term, []).append(plan_id)
+
+        if len(data["plans"]) > MAX_PLANS:
+            oldest = sorted(data["plans"], key=lambda k: data["plans"][k].get("created_at", ""))
+            for old_id in oldest[: len(data["plans"]) - MAX_PLANS]:
+                _unindex(data, old_id)
+
+        _save_store(data)
+    return plan_id
+
+
+def find_similar(city: str, days: int, season_label: str, vibe: str, owner: str) -> dict | None:
+    data = _load_store()
+    keywords = vibe_keywords(vibe)
+    cutoff = (datetime.utcnow() - MAX_PLAN_AGE).isoformat() + "Z"
+
+    scored = []
+    for plan_id in _find_candidates(data, city, days, season_label, owner):
+        plan = data["plans"][plan_id]
+        if plan.get("created_at", "") < cutoff:
+            continue
+        score = _jaccard(keywords, plan.get("vibe_keywords", []))
+        if score >= MIN_VIBE_SIMILARITY:
+            scored.append((score, plan.get("created_at", ""), plan))
+
+    if not scored:
+        return None
+    # Best vibe match first, newest plan as tie-breaker
+    return max(scored, key=lambda x: (x[0], x[1]))[2]
+
+
+def redate_itinerary(itinerary: str, dates: list[str]) -> str:
+    def _sub(m: re.Match) -> str:
+        n = int(m.group(2))
+        if 1 <= n <= len(dates):
+            return f"{m.group(1)}{dates[n - 1]}{m.group(3)}"
+        return m.group(0)
+
+    return _DAY_HEADER_RE.sub(_sub, itinerary)
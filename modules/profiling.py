@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # /app
+PROFILE_DIR = os.path.join(BASE_DIR, "logs", "profiles")
+
+INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+TOP_N = 20
+# Most recent profiles kept in PROFILE_DIR; older .folded/.txt pairs are deleted on write
+MAX_PROFILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+# Leaf frames of threads that are parked (idle pool workers, condition waits)
+IDLE_LEAVES = {("threading.py", "wait"), ("queue.py", "get")}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples Python stacks from a background thread every INTERVAL_SECONDS via
+    sys._current_frames(). Only the watched threads are sampled (all threads when
+    thread_ids is None); nothing runs while no profiler is started.
+    """
+
+    def __init__(self, name: str, thread_ids: set[int] | None = None, interval: float = INTERVAL_SECONDS):
+        self.name = name
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._started = 0.0
+        self._base: str | None = None
+        self.duration = 0.0
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for tid, frame in sys._current_frames().items():
+                if tid == own or (self.thread_ids is not None and tid not in self.thread_ids):
+                    continue
+                leaf = frame.f_code
+                if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def summary(self) -> str:
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, n in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += n
+            for label in set(frames):
+                total_counts[label] += n
+        hits = sum(self.stacks.values()) or 1
+
+        lines = [
+            f"Profile: {self.name}",
+            f"Duration {self.duration:.2f}s, {self.samples} ticks every {self.interval * 1000:.0f} ms, "
+            f"{hits} stack samples ({'all threads' if self.thread_ids is None else 'request thread'})",
+            "",
+            f"Top {TOP_N} by self samples:",
+        ]
+        lines += [f"  {100 * n / hits:5.1f}%  {n:6d}  {label}" for label, n in self_counts.most_common(TOP_N)]
+        lines += ["", f"Top {TOP_N} by total samples (incl. callees):"]
+        lines += [f"  {100 * n / hits:5.1f}%  {n:6d}  {label}" for label, n in total_counts.most_common(TOP_N)]
+        return "\n".join(lines) + "\n"
+
+    def paths(self) -> tuple[str, str]:
+        # Fixed on first use, so callers can name the files before write() runs
+        if self._base is None:
+            safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in self.name)[:60]
+            self._base = os.path.join(PROFILE_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{safe_name}")
+        return self._base + ".folded", self._base + ".txt"
+
+    def write(self) -> tuple[str, str]:
+        """
+        Writes <stamp>_<name>.folded (collapsed stacks, for flamegraph.pl / speedscope)
+        and <stamp>_<name>.txt (top-N summary). Returns both paths.
+        """
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.splitext(self.paths()[0])[0]
+
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(self.summary())
+        _prune()
+        return base + ".folded", base + ".txt"
+
+
+def _prune() -> None:
+    # Names start with a sortable timestamp, so the oldest profiles sort first
+    bases = sorted({os.path.splitext(n)[0] for n in os.listdir(PROFILE_DIR) if n.endswith((".folded", ".txt"))})
+    for base in bases[: max(0, len(bases) - MAX_PROFILES)]:
+        for ext in (".folded", ".txt"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, base + ext))
+            except OSError:
+                pass
+
+
+@contextmanager
+def profile(name: str, all_threads: bool = True):
+    """Profiles the block and writes the result under logs/profiles/."""
+    profiler = SamplingProfiler(name, None if all_threads else {threading.get_ident()})
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        folded, summary = profiler.write()
+        print(f"[profile] {profiler.samples} samples -> {folded}\n[profile] summary -> {summary}", file=sys.stderr)
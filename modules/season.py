@@ -1,3 +1,5 @@
+from datetime import datetime, timedelta
+
 TROPICAL_COUNTRIES = {
     "Indonesia", "Philippines", "Singapore", "Malaysia", "Thailand", "Vietnam", "Cambodia", "Laos", "Brunei",
 }
@@ -33,40 +35,77 @@ def season_label_for_tropical_monsoon(country: str, month: int) -> str:
 def season_label_for_tropical_generic(month: int) -> str:
     return "Warm humid season" if month in (6, 7, 8, 9) else "Hot humid season"
 
-def build_season_profile(city_info: dict, start_date: str) -> dict:
-    country = city_info["country"]
-    lat = city_info["latitude"]
-    hemisphere = city_info["hemisphere"]
-    month = int(start_date.split("-")[1])
+_TEMPERATE_NOTES = {
+    "Winter": "Cold/short daylight: prefer indoor + short outdoor highlights.",
+    "Summer": "Warm/hot: use mornings/evenings; avoid midday heat; hydrate.",
+    "Spring": "Mild: great for parks and walking routes.",
+    "Autumn": "Cooler: mix indoor/outdoor; possible autumn colors.",
+}
+
+def _monsoon_notes(label: str) -> str:
+    if "Rainy" in label:
+        return "Humid with frequent rain: plan indoor-heavy with flexible backups."
+    if "Cool dry" in label:
+        return "Relatively cooler/drier: great for outdoor sightseeing."
+    if "Hot dry" in label:
+        return "Hot and sunny: avoid midday heat; shade breaks."
+    return "Warm tropical: mix outdoor with indoor rest."
+
+def _build_table() -> dict[tuple[str, str], tuple[tuple[str, str], ...]]:
+    # (climate type, hemisphere or country) -> 12 (label, notes) pairs, January first
+    months = range(1, 13)
+    table = {
+        ("temperate-4-season", hemisphere): tuple(
+            (label, _TEMPERATE_NOTES[label])
+            for label in (season_label_for_temperate(hemisphere, m) for m in months)
+        )
+        for hemisphere in ("Northern", "Southern")
+    }
+    for country in sorted(TROPICAL_COUNTRIES) + [""]:
+        table[("tropical-monsoon", country)] = tuple(
+            (label, _monsoon_notes(label))
+            for label in (season_label_for_tropical_monsoon(country, m) for m in months)
+        )
+    table[("tropical-generic", "")] = tuple(
+        (season_label_for_tropical_generic(m), "Warm/humid: mix outdoor with indoor rest.") for m in months
+    )
+    return table
 
-    climate_type = classify_climate(country, lat)
+_SEASON_TABLE = _build_table()
 
+def _table_key(city_info: dict) -> tuple[str, str]:
+    climate_type = classify_climate(city_info["country"], city_info["latitude"])
     if climate_type == "temperate-4-season":
-        label = season_label_for_temperate(hemisphere, month)
-        notes = {
-            "Winter": "Cold/short daylight: prefer indoor + short outdoor highlights.",
-            "Summer": "Warm/hot: use mornings/evenings; avoid midday heat; hydrate.",
-            "Spring": "Mild: great for parks and walking routes.",
-            "Autumn": "Cooler: mix indoor/outdoor; possible autumn colors.",
-        }[label]
-    elif climate_type == "tropical-monsoon":
-        label = season_label_for_tropical_monsoon(country, month)
-        if "Rainy" in label:
-            notes = "Humid with frequent rain: plan indoor-heavy with flexible backups."
-        elif "Cool dry" in label:
-            notes = "Relatively cooler/drier: great for outdoor sightseeing."
-        elif "Hot dry" in label:
-            notes = "Hot and sunny: avoid midday heat; shade breaks."
+        return climate_type, city_info["hemisphere"]
+    if climate_type == "tropical-monsoon":
+        return climate_type, city_info["country"]
+    return climate_type, ""
+
+def season_runs(city_info: dict, start_date: str, days: int) -> list[dict]:
+    """
+    Seasons over the whole trip as consecutive runs:
+    [{"label", "notes", "first_day", "last_day", "start", "end"}, ...] (days are 1-based).
+    Works month by month, so the cost depends on the months spanned, not the days.
+    """
+    months = _SEASON_TABLE[_table_key(city_info)]
+    first = day = datetime.strptime(start_date, "%Y-%m-%d").date()
+    last = first + timedelta(days=days - 1)
+
+    runs: list[dict] = []
+    while day <= last:
+        next_month = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+        month_end = min(last, next_month - timedelta(days=1))
+        label, notes = months[day.month - 1]
+        first_day = (day - first).days + 1
+        last_day = (month_end - first).days + 1
+        if runs and runs[-1]["label"] == label:
+            runs[-1].update(last_day=last_day, end=month_end.isoformat())
         else:
-            notes = "Warm tropical: mix outdoor with indoor rest."
-    else:
-        label = season_label_for_tropical_generic(month)
-        notes = "Warm/humid: mix outdoor with indoor rest."
+            runs.append({"label": label, "notes": notes, "first_day": first_day, "last_day": last_day,
+                         "start": day.isoformat(), "end": month_end.isoformat()})
+        day = next_month
+    return runs
 
-    return {
-        "climate_type": climate_type,
-        "label": label,
-        "hemisphere": hemisphere,
-        "country": country,
-        "notes": notes,
-    }
+def trip_season_label(runs: list[dict]) -> str:
+    # "Autumn" or "Autumn/Winter" for trips crossing seasons
+    return "/".join(r["label"] for r in runs)
@@ -0,0 +1,105 @@
+import os
+import json
+import math
+import threading
+
+STATS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)),
+    "data",
+    "token_stats.json",
+)
+
+MAX_SAMPLES = 50  # most recent observations kept per key
+MIN_SAMPLES = 5  # below this the caller's default budget is used
+PERCENTILE = 0.95
+HEADROOM = 1.15
+# A truncated output is only a lower bound of what the model wanted to write
+TRUNCATED_GROWTH = 1.5
+
+_lock = threading.Lock()
+# (stamp, parsed stats file), reused until the file's (path, mtime, size) changes, so samples
+# recorded by other processes (CLI runs next to the web app) are picked up
+_memo: tuple = (None, {})
+
+
+def _key(mode: str, model: str, days: int) -> str:
+    return f"{mode}|{model}|{int(days)}"
+
+
+def _stamp():
+    try:
+        st = os.stat(STATS_PATH)
+    except OSError:
+        return None
+    return STATS_PATH, st.st_mtime_ns, st.st_size
+
+
+def _load() -> dict:
+    global _memo
+    stamp = _stamp()
+    if stamp is None:
+        return {}
+    memo_stamp, memo_data = _memo
+    if stamp == memo_stamp:
+        return memo_data
+    try:
+        with open(STATS_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return {}
+    _memo = (stamp, data)
+    return data
+
+
+def _save(data: dict) -> None:
+    global _memo
+    os.makedirs(os.path.dirname(STATS_PATH), exist_ok=True)
+    tmp_path = f"{STATS_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, STATS_PATH)
+    _memo = (_stamp(), data)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct * len(ordered)) - 1)]
+
+
+def record(mode: str, model: str, days: int, output_tokens: int, truncated: bool = False) -> None:
+    if not output_tokens:
+        return
+    value = int(output_tokens * TRUNCATED_GROWTH) if truncated else int(output_tokens)
+    key = _key(mode, model, days)
+    with _lock:
+        # Copy on write: readers may still hold the memoized dict
+        data = dict(_load())
+        entry = data.get(key) or {"samples": [], "truncated": 0}
+        data[key] = {
+            "samples": (entry["samples"] + [value])[-MAX_SAMPLES:],
+            "truncated": entry["truncated"] + (1 if truncated else 0),
+        }
+        _save(data)
+
+
+def budget(mode: str, model: str, days: int, default: int, floor: int, ceiling: int) -> int:
+    """
+    num_predict for a new request: a high percentile of the output lengths observed for
+    this mode/model/days plus headroom. Day counts without enough samples are scaled from
+    the per-day lengths seen for other day counts; with no history at all, `default`.
+    """
+    with _lock:
+        data = _load()
+        samples = list((data.get(_key(mode, model, days)) or {}).get("samples", []))
+        if len(samples) < MIN_SAMPLES and days > 0:
+            prefix = f"{mode}|{model}|"
+            samples = [
+                s / int(k[len(prefix):]) * days
+                for k, v in data.items() if k.startswith(prefix) and int(k[len(prefix):]) > 0
+                for s in v.get("samples", [])
+            ]
+
+    if len(samples) < MIN_SAMPLES:
+        return default
+    return max(floor, min(ceiling, int(_percentile(samples, PERCENTILE) * HEADROOM)))
+
@@ -43,14 +43,31 @@ def validate_itinerary(itinerary_text: str, allowed_place_names: list[str], days
 
     return "OK"
 
-def auto_fix_itinerary(itinerary_text: str, allowed_place_names: list[str], days: int) -> str | None:
+def auto_fix_itinerary(itinerary_text: str, allowed_place_names: list[str], days: int,
+                       num_predict: int = 520, session: "llm.ChatSession | None" = None) -> str | None:
     """
     Returns corrected itinerary text, or None if it couldn't be fixed safely.
+    With the planner's session, the fix is a short follow-up in the same chat (the
+    itinerary is its latest answer) instead of a new prompt that repeats everything.
     """
     verdict = validate_itinerary(itinerary_text, allowed_place_names, days)
     if verdict == "OK":
         return itinerary_text
 
+    if session is not None:
+        instruction = f"""
+That itinerary failed validation.
+Instruction:
+{verdict}
+
+Return ONLY the corrected itinerary text for all {days} days, same format, allowed place names only (NOT 'OK', NOT 'FIX:').
+"""
+        data = session.correct(instruction.strip(), num_predict=num_predict)
+        if data.get("done_reason") == "length":
+            # A cut-off fix can still look valid when the missing tail is "Places Used"
+            return None
+        return _accept_fix((data.get("message", {}).get("content", "") or "").strip(), allowed_place_names, days)
+
     fix_prompt = f"""
 Allowed places (use ONLY these exact names):
 {allowed_place_names}
@@ -65,8 +82,11 @@ Instruction:
 
 Return ONLY the corrected itinerary text (NOT 'OK', NOT 'FIX:').
 """
-    corrected = llm.call_llm(VALIDATE_PROMPT, fix_prompt, num_predict=520).strip()
+    # The corrected itinerary is as long as the original, so callers pass the planner budget
+    corrected = llm.call_llm(VALIDATE_PROMPT, fix_prompt, num_predict=num_predict).strip()
+    return _accept_fix(corrected, allowed_place_names, days)
 
+def _accept_fix(corrected: str, allowed_place_names: list[str], days: int) -> str | None:
     # Critical guard: never pass FIX/OK into PDF as itinerary
     if not corrected or corrected.upper() == "OK" or corrected.upper().startswith("FIX:"):
         return None
@@ -1,8 +1,20 @@
+import io
 import os
-from flask import Flask, render_template, request, send_from_directory, jsonify
+import json
+import gzip
+import uuid
+import hashlib
+import threading
+from functools import partial
+from flask import Flask, Response, abort, g, make_response, render_template, request, send_file, jsonify
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
-from modules.agent_core import summarize_file, plan_trip, maybe_send_email, export_plan_pdf, get_user_history
+from modules.agent_core import (
+    summarize_file, plan_trip, maybe_send_email, export_plan_pdf, get_user_history,
+    planner_num_predict, summarize_num_predict,
+)
+from modules import outbox, metrics, admission
 
 BASE_DIR = os.path.dirname(__file__)
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
@@ -10,27 +22,152 @@ EXPORT_PDF_DIR = os.path.join(BASE_DIR, "exports", "itineraries")
 
 ALLOWED_EXTS = {".pdf", ".png", ".jpg", ".jpeg", ".webp"}
 
+GZIP_MIMETYPES = {"text/html", "application/json"}
+GZIP_MIN_BYTES = 512
+BATCH_MAX_TRIPS = 200
+# Per-request profiling via "X-Profile: 1" or "?profile=1"; off unless set to 1 (any client can ask)
+ALLOW_REQUEST_PROFILING = os.getenv("ALLOW_REQUEST_PROFILING", "0").strip().lower() not in ("0", "false", "no")
+# Export names are unique per render, so a given URL always serves the same bytes
+PDF_MAX_AGE = 24 * 3600
+
+# "memory": render itinerary PDFs into an in-process buffer instead of exports/itineraries/
+PDF_EXPORT_MODE = os.getenv("PDF_EXPORT_MODE", "disk").strip().lower()
+
 app = Flask(__name__, template_folder="web/templates")
 app.config["MAX_CONTENT_LENGTH"] = 20 * 1024 * 1024
 
+# Content hash per (path, mtime, size), so each PDF on disk is hashed once
+_file_etags: dict[tuple, str] = {}
+_file_etags_lock = threading.Lock()
+
 def allowed_file(filename: str) -> bool:
     _, ext = os.path.splitext(filename.lower())
     return ext in ALLOWED_EXTS
 
+def file_etag(path: str) -> str:
+    st = os.stat(path)
+    stamp = (path, st.st_mtime_ns, st.st_size)
+    with _file_etags_lock:
+        if stamp in _file_etags:
+            return _file_etags[stamp]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    with _file_etags_lock:
+        _file_etags[stamp] = h.hexdigest()[:32]
+        return _file_etags[stamp]
+
+def too_busy(e: admission.AdmissionRejected, **context):
+    resp = make_response(render_template("index.html", **context), 429)
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+@app.before_request
+def ensure_outbox_worker():
+    # Started from the serving process (not the debug reloader) so leftover
+    # messages in data/outbox are delivered without waiting for a new email
+    outbox.start_worker()
+
+@app.before_request
+def start_profile():
+    if not ALLOW_REQUEST_PROFILING:
+        return
+    if request.headers.get("X-Profile") != "1" and request.args.get("profile") != "1":
+        return
+    from modules import profiling
+
+    # Only the thread serving this request is sampled, so concurrent requests don't mix in
+    g.profiler = profiling.SamplingProfiler(f"{request.method}_{request.path}", {threading.get_ident()})
+    g.profiler.start()
+
+@app.after_request
+def name_profile(resp):
+    profiler = g.get("profiler")
+    if profiler is None:
+        return resp
+    # File names under logs/profiles/; written on teardown
+    folded, summary = profiler.paths()
+    resp.headers["X-Profile-Path"] = os.path.basename(folded)
+    resp.headers["X-Profile-Summary"] = os.path.basename(summary)
+    return resp
+
+@app.teardown_request
+def finish_profile(exc):
+    # Runs even when the view raised, so the sampler thread never outlives its request
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return
+    profiler.stop()
+    profiler.write()
+
+@app.after_request
+def gzip_response(resp):
+    if resp.mimetype not in GZIP_MIMETYPES or resp.direct_passthrough or resp.status_code != 200:
+        return resp
+    resp.vary.add("Accept-Encoding")
+    if "Content-Encoding" in resp.headers or "gzip" not in request.headers.get("Accept-Encoding", "").lower():
+        return resp
+
+    data = resp.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return resp
+    resp.set_data(gzip.compress(data, compresslevel=6))
+    resp.headers["Content-Encoding"] = "gzip"
+    # A strong ETag names one exact representation, so the gzipped body gets its own
+    etag, weak = resp.get_etag()
+    if etag and not weak:
+        resp.set_etag(f"{etag}-gzip")
+    return resp
+
 @app.get("/")
 def home():
     return render_template("index.html")
 
 @app.get("/download/<path:filename>")
 def download_file(filename):
-    return send_from_directory(EXPORT_PDF_DIR, filename, as_attachment=True)
+    from modules import pdf_export
+
+    # Strong content-hash ETags; conditional=True answers If-None-Match/If-Modified-Since
+    # with 304 and Range requests with 206
+    entry = pdf_export.get_memory_pdf_entry(filename)
+    if entry is not None:
+        data, etag = entry
+        return send_file(io.BytesIO(data), mimetype="application/pdf", as_attachment=True, download_name=filename,
+                         etag=etag, conditional=True, max_age=PDF_MAX_AGE)
+
+    path = safe_join(EXPORT_PDF_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return send_file(path, mimetype="application/pdf", as_attachment=True, download_name=os.path.basename(path),
+                     etag=file_etag(path), conditional=True, max_age=PDF_MAX_AGE)
+
+@app.get("/metrics")
+def metrics_route():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.get("/metrics/backends")
+def backends_route():
+    from modules import llm
+
+    return jsonify({"backends": llm.backend_stats()})
 
 @app.get("/history")
 def history_route():
     name = request.args.get("name", "").strip()
     if not name:
         return jsonify({"error": "missing ?name="}), 400
-    return jsonify({"name": name, "history": get_user_history(name)})
+
+    resp = jsonify({"name": name, "history": get_user_history(name)})
+    etag = hashlib.sha256(resp.get_data()).hexdigest()[:32]
+    for tag in (etag, f"{etag}-gzip"):
+        if request.if_none_match.contains(tag):
+            resp = Response(status=304)
+            etag = tag
+            break
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp
 
 @app.post("/summarize")
 def summarize_route():
@@ -44,20 +181,26 @@ def summarize_route():
         return render_template("index.html", sum_error="Unsupported file type."), 400
 
     os.makedirs(UPLOAD_DIR, exist_ok=True)
-    filename = secure_filename(file.filename)
+    # Unique prefix so concurrent uploads with the same name don't overwrite each other
+    filename = f"{uuid.uuid4().hex[:8]}_{secure_filename(file.filename)}"
     path = os.path.join(UPLOAD_DIR, filename)
     file.save(path)
 
+    # Uploads carry no user name; the client address keys the quota instead
+    cost = admission.estimate_cost(summarize_num_predict(), prompt_tokens=2000)
+    gate = partial(admission.admit, f"ip:{request.remote_addr}", cost)
     try:
-        result = summarize_file(path)
+        result = summarize_file(path, admit=gate)
         if do_email and email:
             maybe_send_email(email, "Travel Summary", result)
-            sum_notice = f"Summary generated and emailed to {email}."
+            sum_notice = f"Summary generated and queued for email to {email}."
         elif do_email and not email:
             sum_notice = "Summary generated, but email is empty."
         else:
             sum_notice = "Summary generated (not emailed)."
         return render_template("index.html", sum_result=result, sum_notice=sum_notice)
+    except admission.AdmissionRejected as e:
+        return too_busy(e, sum_error=str(e))
     except Exception as e:
         return render_template("index.html", sum_error=str(e)), 500
 
@@ -75,6 +218,7 @@ def plan_route():
 
     do_email = request.form.get("do_email") == "on"
     fast_mode = request.form.get("fast_mode") == "on"
+    reuse_plan = request.form.get("reuse_plan") == "on"
     export_pdf = request.form.get("export_pdf") == "on"
 
     if not city or not start or not days:
@@ -87,16 +231,24 @@ def plan_route():
     except ValueError:
         return render_template("index.html", plan_error="Days must be an integer."), 400
 
+    cost = admission.estimate_cost(planner_num_predict(days_int))
+    # Only the LLM generation holds an admission slot; lookups, reuse hits and PDF work don't
+    gate = partial(admission.admit, user_name, cost)
     try:
         if export_pdf:
-            pdf_path, itinerary_text = export_plan_pdf(city, start, days_int, user_name, vibe, fast_mode)
+            in_memory = PDF_EXPORT_MODE == "memory"
+            pdf_path, itinerary_text = export_plan_pdf(city, start, days_int, user_name, vibe, fast_mode,
+                                                       in_memory=in_memory, reuse=reuse_plan, admit=gate)
             pdf_name = os.path.basename(pdf_path)
 
             if do_email and email:
+                from modules import pdf_export
+
                 subject = f"{days_int}-Day Travel Itinerary – {city} (from {start})"
                 body = itinerary_text + f"\n\nAttached: PDF itinerary with photos.\nUser: {user_name}"
-                maybe_send_email(email, subject, body, attachments=[pdf_path])
-                plan_notice = f"PDF generated and emailed to {email}."
+                attachment = (pdf_name, pdf_export.get_memory_pdf(pdf_name)) if in_memory else pdf_path
+                maybe_send_email(email, subject, body, attachments=[attachment])
+                plan_notice = f"PDF generated and queued for email to {email}."
             else:
                 plan_notice = "PDF generated (not emailed)."
 
@@ -107,12 +259,13 @@ def plan_route():
                 pdf_link=f"/download/{pdf_name}",
             )
 
-        itinerary_text, _ = plan_trip(city, start, days_int, user_name, vibe, fast_mode)
+        itinerary_text, _ = plan_trip(city, start, days_int, user_name, vibe, fast_mode, reuse=reuse_plan,
+                                      admit=gate)
 
         if do_email and email:
             subject = f"{days_int}-Day Travel Itinerary – {city} (from {start})"
             maybe_send_email(email, subject, itinerary_text + f"\n\nUser: {user_name}")
-            plan_notice = f"Itinerary generated and emailed to {email}."
+            plan_notice = f"Itinerary generated and queued for email to {email}."
         elif do_email and not email:
             plan_notice = "Itinerary generated, but email is empty."
         else:
@@ -120,8 +273,59 @@ def plan_route():
 
         return render_template("index.html", plan_result=itinerary_text, plan_notice=plan_notice)
 
+    except admission.AdmissionRejected as e:
+        return too_busy(e, plan_error=str(e))
     except Exception as e:
         return render_template("index.html", plan_error=str(e)), 500
 
+@app.post("/plan/batch")
+def plan_batch_route():
+    """
+    Body: JSON list of trips (or {"trips": [...]}) or NDJSON, each with city, start, days[, user, vibe].
+    Streams one NDJSON line per trip as soon as it is planned. ?reuse=1 allows returning a
+    user's recent stored plan for a matching trip.
+    """
+    from modules import batch
+
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        try:
+            trips = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            return jsonify({"error": f"invalid NDJSON: {e}"}), 400
+    else:
+        body = request.get_json(silent=True)
+        trips = body.get("trips") if isinstance(body, dict) else body
+    if not isinstance(trips, list) or not trips:
+        return jsonify({"error": "expected a non-empty list of trips"}), 400
+    if len(trips) > BATCH_MAX_TRIPS:
+        return jsonify({"error": f"at most {BATCH_MAX_TRIPS} trips per batch"}), 400
+
+    reuse = request.args.get("reuse") == "1"
+    rows = batch.parse_rows(trips)
+    for r in rows:
+        if "error" not in r and r["days"] > 30:
+            r["error"] = "days must be between 1 and 30"
+
+    # The batch is charged once against the client's batch quota; its rows then wait in the
+    # fair queue (keyed by client, not by the per-row user names) instead of failing on arrival
+    client = f"ip:{request.remote_addr}"
+    costs = {r["row"]: admission.estimate_cost(planner_num_predict(r["days"])) for r in rows if "error" not in r}
+    try:
+        admission.charge_batch(client, sum(costs.values()))
+    except admission.AdmissionRejected as e:
+        resp = jsonify({"error": str(e)})
+        resp.status_code = 429
+        resp.headers["Retry-After"] = str(e.retry_after)
+        return resp
+
+    def admit(row):
+        return admission.admit(client, costs[row["row"]], prepaid=True)
+
+    def stream():
+        for result in batch.plan_batch(rows, fast=True, admit=admit, reuse=reuse):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return Response(stream(), mimetype="application/x-ndjson")
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)